@@ -1,51 +1,118 @@
+import os
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request
+from .async_bot import AsyncBot, AsyncMethods
+from .broadcast import Broadcast
+from .dispatcher import Dispatcher
+from .download import FileDownloadError
+from .file_cache import FileIdCache, MemoryFileIdStore, SQLiteFileIdStore
+from .filters import Filter, Predicate
+from .log import UpdateLog, handler_name, logger
+from .metrics import Metrics
+from .middleware import FunctionMiddleware, Middleware, middleware_name
 from .methods import Methods
-from .utils import to_namedtuple
-
-class Bot(Methods):
-    def __init__(self, token, name=None, webhook=None):
-        super().__init__(token)
-        self.handlers = {
-            "message": [],
-            "edited_message": [],
-            "channel_post": [],
-            "edited_channel_post": [],
-            "inline_query": [],
-            "chosen_inline_result": [],
-            "callback_query": [],
-            "shipping_query": [],
-            "pre_checkout_query": [],
-            "poll": [],
-            "poll_answer": [],
-            "my_chat_member": [],
-            "chat_member": [],
-            "chat_join_request": [],
-            "message_reaction": [],
-            "message_reaction_count": [],
-            "chat_boost": [],
-            "removed_chat_boost": [],
-            "business_connection": [],
-            "business_message": [],
-            "edited_business_message": [],
-            "deleted_business_messages": [],
-        }
+from .offsets import FileUpdateStore, MemoryUpdateStore, SQLiteUpdateStore
+from .ratelimit import RateLimiter
+from .server import create_app, create_asgi_app
+from .state import CachedStateStorage, MemoryStateStorage, SQLiteStateStorage
+from .transport import Transport
+from .utils import TelegramPollingError, get_update_key, polling_backoff, to_namedtuple, to_view
+from .workers import HashRing, ProcessWorkerPool, ShardedWorkerPool
+
+class Bot(Methods, Dispatcher):
+    """
+    Parameters:
+        token (str): The bot token.
+        name (str): Name used in the webhook route, /{name}/webhook.
+        webhook (str): Run with a webhook instead of polling.
+        lazy_updates (bool): Pass UpdateView objects to handlers instead of namedtuples.
+        rate_limiter (RateLimiter): Throttles outgoing messages, see ratelimit.RateLimiter.
+        me_cache (str): Path of a JSON file that keeps the getMe result between runs.
+        me_ttl (int): Seconds a cached getMe result stays valid.
+        log_sample_rate (float): Fraction of updates written to the 'TGramBot.updates' logger.
+        metrics (bool or Metrics): Record handler, filter and API latency metrics. True uses
+            the shared metrics.registry.
+        file_id_cache (FileIdCache): Reuse the file_id of local files already uploaded once.
+        download_cache (str): Directory where download_file keeps files by file_unique_id.
+        update_store (MemoryUpdateStore): Keeps the polling offset between runs and drops
+            updates that were already delivered, see offsets.MemoryUpdateStore.
+        transport (Transport): Timeouts, retries and connection pool sizes of API requests.
+        state_storage: Where bot.state() keeps conversation states. Defaults to an
+            in-memory LRU; see state.CachedStateStorage for persistent backends.
+
+    Nothing is requested from Telegram while the bot is constructed: `me` is
+    fetched with getMe the first time it is read (or loaded from me_cache),
+    and the Flask app is created the first time `app` is used. Assign
+    `bot.me` to skip getMe altogether.
+    """
+
+    def __init__(self, token, name=None, webhook=None, lazy_updates=False, rate_limiter=None, me_cache=None,
+                 me_ttl=86400, log_sample_rate=1.0, metrics=None, file_id_cache=None, download_cache=None,
+                 update_store=None, state_storage=None, transport=None):
+        super().__init__(
+            token, rate_limiter=rate_limiter, metrics=metrics, file_id_cache=file_id_cache,
+            download_cache=download_cache, transport=transport,
+        )
+        Dispatcher.__init__(self, state_storage)
         self.webhook = webhook
+        self.lazy_updates = lazy_updates
         self.name = name
-        self.app = Flask(__name__)
-        self.process_webhook = self.app
-        self.me = self.get_me()
-
-        @self.app.route(f'/{name}/webhook', methods=['POST'])
-        def handle_update():
-            update = request.get_json()
-            print(update)
-            update_type = self.extract_main_key(update)
-            self.process_new_updates(update_type, update[update_type])
+        if name:
+            self.metrics_label = name
+        self.me_cache = me_cache
+        self.me_ttl = me_ttl
+        self._me = None
+        self._app = None
+        self.update_log = UpdateLog(log_sample_rate)
+        self.update_store = update_store
+        self._stop_polling = False
+
+    @property
+    def me(self):
+        if self._me is None:
+            self._me = self._load_cached_me() or self.get_me()
+        return self._me
+
+    @me.setter
+    def me(self, value):
+        self._me = value
+
+    def _load_cached_me(self):
+        if not self.me_cache or not os.path.exists(self.me_cache):
+            return None
+        try:
+            with open(self.me_cache, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - cached.get('saved_at', 0) > self.me_ttl:
+            return None
+        if str(cached.get('result', {}).get('id')) != self.token.split(':', 1)[0]:
+            return None
+        return to_namedtuple("BotInfo", cached['result'])
+
+    def _save_me(self, result):
+        if not self.me_cache:
+            return
+        tmp_path = f"{self.me_cache}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'saved_at': time.time(), 'result': result}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.me_cache)
+
+    @property
+    def app(self):
+        if self._app is None:
+            self._app = self._create_app()
+        return self._app
+
+    @property
+    def process_webhook(self):
+        return self.app
 
-            return 'OK', 200
+    def _create_app(self):
+        return create_app(self)
 
     def extract_main_key(self, data):
         for key in data.keys():
@@ -53,192 +120,239 @@ class Bot(Methods):
                     return key  # إرجاع المفتاح الرئيسي
         return None
 
-    def message_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["message"].append((filter_func, func))
-            return func
-        return decorator
-
-    def edited_message_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["edited_message"].append((filter_func, func))
-            return func
-        return decorator
-
-    def channel_post_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["channel_post"].append((filter_func, func))
-            return func
-        return decorator
-
-    def edited_channel_post_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["edited_channel_post"].append((filter_func, func))
-            return func
-        return decorator
-
-    def inline_query_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["inline_query"].append((filter_func, func))
-            return func
-        return decorator
-
-    def chosen_inline_result_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["chosen_inline_result"].append((filter_func, func))
-            return func
-        return decorator
-
-    def callback_query_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["callback_query"].append((filter_func, func))
-            return func
-        return decorator
-
-    def shipping_query_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["shipping_query"].append((filter_func, func))
-            return func
-        return decorator
-
-    def pre_checkout_query_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["pre_checkout_query"].append((filter_func, func))
-            return func
-        return decorator
-
-    def poll_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["poll"].append((filter_func, func))
-            return func
-        return decorator
-
-    def poll_answer_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["poll_answer"].append((filter_func, func))
-            return func
-        return decorator
-
-    def my_chat_member_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["my_chat_member"].append((filter_func, func))
-            return func
-        return decorator
-
-    def chat_member_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["chat_member"].append((filter_func, func))
-            return func
-        return decorator
-
-    def chat_join_request_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["chat_join_request"].append((filter_func, func))
-            return func
-        return decorator
-
-    def message_reaction_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["message_reaction"].append((filter_func, func))
-            return func
-        return decorator
-
-    def message_reaction_count_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["message_reaction_count"].append((filter_func, func))
-            return func
-        return decorator
-
-    def chat_boost_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["chat_boost"].append((filter_func, func))
-            return func
-        return decorator
-
-    def removed_chat_boost_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["removed_chat_boost"].append((filter_func, func))
-            return func
-        return decorator
-
-    def business_connection_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["business_connection"].append((filter_func, func))
-            return func
-        return decorator
-
-    def business_message_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["business_message"].append((filter_func, func))
-            return func
-        return decorator
-
-    def edited_business_message_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["edited_business_message"].append((filter_func, func))
-            return func
-        return decorator
-
-    def deleted_business_messages_handler(self, filter_func=None):
-        def decorator(func):
-            self.handlers["deleted_business_messages"].append((filter_func, func))
-            return func
-        return decorator
-    
-    def process_new_updates(self, update_type, data):
-        data = to_namedtuple(update_type, data)
-        #print(f"Processing {update_type}: {data}")
-        if update_type in self.handlers:
-            for filter_func, handler in self.handlers[update_type]:
-                # تحقق مما إذا كان هناك دالة فلتر وتطبيقها
-                if filter_func and not filter_func(data):
-                    continue
-                # استدعاء المعالج مباشرة دون تحقق من وجود خاصية message
-                handler(data)  # تمرير البيانات مباشرة إلى المعالج
-                return
+    def process_update(self, update):
+        started = self.update_log.start()
+        update_type = self.extract_main_key(update)
+        if self.batch_handlers:
+            self.feed_batches(update_type, update)
+        handlers = self.process_new_updates(update_type, update[update_type])
+        if started is not None:
+            self.update_log.record(started, update, update_type, handlers)
 
     def process_new_updates(self, update_type, data):
-        data = to_namedtuple(update_type, data)
-        #print(f"Processing {update_type}: {data}")
-    
-        if update_type in self.handlers:
-            for filter_func, handler in self.handlers[update_type]:
-                try:
-                    if filter_func and not filter_func(data):
-                        continue
-                except Exception as e:
-                    # print(f"\033[91mError in filter function: {e}\033[0m")  # 91 هو كود اللون الأحمر
+        """Runs the middlewares and the matching handler of every group; returns the handlers that ran."""
+        data = to_view(update_type, data) if self.lazy_updates else to_namedtuple(update_type, data)
+        middlewares = self._middlewares_by_type.get(update_type)
+        metrics = self.metrics
+        if middlewares or metrics is not None:
+            return self._run_pipeline(update_type, data, middlewares or (), metrics)
+        handlers = self.find_handlers(update_type, data)
+        context = {'handlers': handlers}
+        for handler in handlers:
+            handler.call(data, context)
+        return handlers
+
+    def _run_pipeline(self, update_type, data, middlewares, metrics):
+        context = {'handlers': []}
+        handlers = []
+        ran = []
+        try:
+            for middleware in middlewares:
+                proceed = self._run_hook(middleware, 'pre', update_type, data, context, metrics)
+                ran.append(middleware)
+                if proceed is False:
+                    return handlers
+
+            started = time.perf_counter()
+            handlers = context['handlers'] = self.find_handlers(update_type, data)
+            found = time.perf_counter()
+            if metrics is not None:
+                metrics.updates.inc(self.metrics_label, update_type)
+                metrics.filter_duration.observe(self.metrics_label, update_type, value=found - started)
+            for handler in handlers:
+                if metrics is None:
+                    handler.call(data, context)
                     continue
-    
-                handler(data)
-                return
+                name = handler_name(handler)
+                started = time.perf_counter()
+                try:
+                    handler.call(data, context)
+                except Exception:
+                    metrics.handler_errors.inc(self.metrics_label, update_type, name)
+                    raise
+                finally:
+                    metrics.handler_duration.observe(
+                        self.metrics_label, update_type, name, value=time.perf_counter() - started
+                    )
+            return handlers
+        except Exception as e:
+            context['error'] = e
+            raise
+        finally:
+            for middleware in reversed(ran):
+                try:
+                    self._run_hook(middleware, 'post', update_type, data, context, metrics)
+                except Exception:
+                    logger.exception("Error in post hook of middleware %s", middleware_name(middleware))
+
+    def _run_hook(self, middleware, stage, update_type, data, context, metrics):
+        hook = getattr(middleware, stage)
+        if hook is None:
+            return None
+        if metrics is None:
+            return hook(update_type, data, context)
+        started = time.perf_counter()
+        try:
+            return hook(update_type, data, context)
+        finally:
+            metrics.middleware_duration.observe(
+                self.metrics_label, update_type, middleware_name(middleware), stage,
+                value=time.perf_counter() - started,
+            )
 
     def get_me(self):
         response = self._make_request('getMe')
         if response["ok"]:
-            return to_namedtuple("BotInfo", response['result'])
+            self._save_me(response['result'])
+            self._me = to_namedtuple("BotInfo", response['result'])
+            return self._me
         else:
             raise Exception("INVALID BOT TOKEN")
 
-    def run(self):
+    def broadcast(self, chat_ids, method='send_message', *args, workers=16, checkpoint=None, on_progress=None,
+                  progress_interval=5, **kwargs):
+        """
+        Calls `method` (send_message, copy_message, forward_message, ...) for every
+        chat in chat_ids, concurrently and within rate limits. See Broadcast.
+
+        Example:
+            bot.broadcast(user_ids, 'send_message', 'Hello!', checkpoint='news.jsonl')
+
+        Returns:
+            Broadcast: The finished broadcast with `results` and `stats`.
+        """
+        broadcast = Broadcast(
+            self, chat_ids, method, args, kwargs, workers=workers, checkpoint=checkpoint,
+            on_progress=on_progress, progress_interval=progress_interval,
+        )
+        broadcast.run()
+        return broadcast
+
+    def run(self, workers=0, queue_size=100, processes=0):
         if self.webhook:
-            print(f"Running with Webhook")
-            self.app.run(host='0.0.0.0', port=5000)
+            logger.info("Running with webhook")
+            # Flask's own server, meant for development. In production serve
+            # create_app(bot) (or bot.app) with a WSGI server such as gunicorn.
+            self.app.run(host='0.0.0.0', port=5000, threaded=True)
         else:
-            print("Running with polling (infinity mode)")
-            self.infinity_polling()
+            logger.info("Running with polling (infinity mode)")
+            self.infinity_polling(workers=workers, queue_size=queue_size, processes=processes)
 
-    def infinity_polling(self):
-        offset = 0
-        while True:
+    def _dispatch(self, update, pool):
+        if pool is None:
             try:
-                updates = self._make_request('getUpdates', params={'offset': offset, 'timeout': 100})
-                print("\033[32m", "Updates received:", json.dumps(updates, indent=4, ensure_ascii=False), "\033[0m", "\n")
-                if updates['ok']:
-                    for update in updates['result']:
-                        update_type = self.extract_main_key(update)
-                        self.process_new_updates(update_type, update[update_type])
-                        offset = max(offset, update['update_id'] + 1)
-            except Exception as e:
-                print(f"An error occurred: {e}")  # إدارة الاستثناءات
-            time.sleep(1)
+                self.process_update(update)
+            except Exception:
+                logger.exception("Error while processing update %s", update.get('update_id'))
+        else:
+            update_type = self.extract_main_key(update)
+            pool.submit(get_update_key(update_type, update[update_type]), update)
+
+    def infinity_polling(self, workers=0, queue_size=100, timeout=100, max_backoff=60, processes=0):
+        """
+        Polls getUpdates forever and dispatches every update.
+
+        As soon as a batch arrives the offset moves past it and the next long-poll
+        request is sent from a background thread, so it is already waiting on
+        Telegram while the current batch is handled. There is no pause between
+        successful polls; failed polls are retried with exponential backoff (or
+        after retry_after when Telegram asks for it).
+
+        Parameters:
+            workers (int): Number of worker threads. With 0 (the default) handlers run
+                inline in the polling loop. Otherwise updates are sharded by chat id
+                (or sender id), keeping per-chat order while different chats run in
+                parallel.
+            queue_size (int): Maximum number of pending updates per worker. The poller
+                blocks when a worker's queue is full.
+            timeout (int): Long polling timeout passed to getUpdates.
+            max_backoff (int): Upper bound in seconds for the delay after errors.
+            processes (int): Number of worker processes, see workers.ProcessWorkerPool.
+                Updates are routed to them by a consistent hash of the chat id, so
+                CPU-heavy handlers are not serialized by the GIL. Takes precedence
+                over workers. Metrics and in-memory state are kept per process.
+
+        Without an update_store delivery is at-most-once: the next request confirms
+        a batch to Telegram while it is still being handled, so updates in flight
+        when the process dies are lost. With an update_store it is at-least-once:
+        the first request starts at the stored offset, updates already seen are
+        skipped, and the next request is only sent after every update of the batch
+        has been handled (waiting for the workers) and the offset committed. A
+        crash in between redelivers the batch on restart, and this loses the
+        overlap between handling a batch and polling for the next one.
+
+        Batch handlers get the updates of a polled batch as soon as it has been
+        dispatched (with an update_store, or when handlers run inline) rather
+        than after their max_wait. Batch handlers in worker processes keep
+        their own buffers, which an update_store does not cover.
+        """
+        if processes:
+            pool = ProcessWorkerPool(self.process_update, processes, queue_size, initializer=self.reset_connections)
+        else:
+            pool = ShardedWorkerPool(self.process_update, workers, queue_size) if workers else None
+        if pool is not None and self.metrics is not None:
+            self.metrics.queue_depth.set_function(self.metrics_label, function=pool.qsize)
+        fetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="TGramBot-poller")
+        store = self.update_store
+        offset = store.offset if store is not None else 0
+        errors = 0
+        self._stop_polling = False
+        try:
+            pending = fetcher.submit(self.get_updates, offset=offset, timeout=timeout)
+            while not self._stop_polling:
+                try:
+                    updates = pending.result()
+                    if not updates['ok']:
+                        raise TelegramPollingError(updates)
+                except Exception as e:
+                    logger.warning("getUpdates failed: %s", e)
+                    errors += 1
+                    time.sleep(polling_backoff(errors, e, max_backoff))
+                    pending = fetcher.submit(self.get_updates, offset=offset, timeout=timeout)
+                    continue
+
+                errors = 0
+                batch = updates['result']
+                logger.debug("Received %d updates: %s", len(batch), batch)
+                for update in batch:
+                    offset = max(offset, update['update_id'] + 1)
+                if store is None:
+                    pending = fetcher.submit(self.get_updates, offset=offset, timeout=timeout)
+                    for update in batch:
+                        self._dispatch(update, pool)
+                    if pool is None and batch:
+                        # Every update of the batch reached its batchers; hand them over together.
+                        self.flush_batches()
+                    continue
+
+                # The next request confirms this batch to Telegram, so it is only
+                # sent once the batch has been handled and the offset committed.
+                accepted = set()
+                for update in batch:
+                    update_id = update['update_id']
+                    if update_id in store or update_id in accepted:
+                        logger.debug("Skipping duplicate update %s", update_id)
+                        continue
+                    accepted.add(update_id)
+                    self._dispatch(update, pool)
+                if batch:
+                    if pool is not None:
+                        pool.join()
+                    # Updates still buffered by batch handlers are not handled yet.
+                    self.flush_batches()
+                    store.commit(offset)
+                pending = fetcher.submit(self.get_updates, offset=offset, timeout=timeout)
+        finally:
+            fetcher.shutdown(wait=False)
+            if pool is not None:
+                # After stop_polling, let the workers finish what was already queued.
+                pool.stop(wait=self._stop_polling)
+            if self._stop_polling:
+                self.flush_batches()
+
+    def stop_polling(self):
+        """
+        Makes infinity_polling return once the long poll in flight completes (at
+        most its timeout). Updates already queued to workers are still handled.
+        """
+        self._stop_polling = True
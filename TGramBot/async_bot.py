@@ -0,0 +1,471 @@
+import asyncio
+import inspect
+import io
+import mmap
+import os
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import download
+from . import metrics as metrics_module
+from . import serializer
+from .batching import AsyncUpdateBatcher
+from .dispatcher import Dispatcher
+from .file_cache import is_file_id_rejected
+from .log import UpdateLog, handler_name, logger
+from .multipart import MultipartEncoder, form_value, split_params
+from .methods import Methods
+from .middleware import middleware_name
+from .ratelimit import get_retry_after, is_rate_limited
+from .transport import Transport
+from .utils import TelegramPollingError, get_update_key, polling_backoff, to_namedtuple, to_view
+
+
+class AsyncMethods(Methods):
+    """
+    Bot API methods as coroutines.
+
+    Every method inherited from Methods returns the result of _make_request,
+    so overriding it with a coroutine turns `send_message(...)` and the rest
+    into awaitables without redefining them. Requests share one aiohttp
+    session whose connection pool is capped at connection_limit. Timeouts come
+    from transport (see transport.Transport); its retry and pool settings only
+    apply to the urllib3 based Methods.
+    """
+
+    def __init__(self, token, connection_limit=100, rate_limiter=None, metrics=None, file_id_cache=None,
+                 download_cache=None, transport=None):
+        if aiohttp is None:
+            raise ImportError("AsyncMethods requires aiohttp: pip install aiohttp")
+        self.token = token
+        self.transport = transport if transport is not None else Transport()
+        self.api_url = f"{self.transport.base_url}/bot{self.token}"
+        self.file_url = f"{self.transport.base_url}/file/bot{self.token}"
+        self.download_cache = download_cache
+        self.connection_limit = connection_limit
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics_module.resolve(metrics)
+        self.metrics_label = token.split(':', 1)[0]
+        self.file_id_cache = file_id_cache
+        self.session = None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit),
+                timeout=aiohttp.ClientTimeout(total=None),
+            )
+        return self.session
+
+    def reset_connections(self):
+        """Forgets the session, e.g. in a forked worker process."""
+        self.session = None
+
+    def _timeout(self, method, params=None, files=None):
+        connect, read = self.transport.timeouts(method, params, files)
+        return aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+
+    def _build_form(self, params, files):
+        # aiohttp streams file objects in chunks, so paths are opened rather than read.
+        form = aiohttp.FormData()
+        opened = []
+        for key, value in params.items():
+            if value is not None:
+                form.add_field(key, form_value(value))
+        encoder = MultipartEncoder(files=files)
+        for part in encoder.files:
+            value = part.value
+            if isinstance(value, os.PathLike):
+                value = open(value, 'rb')
+                opened.append(value)
+            elif isinstance(value, (memoryview, mmap.mmap)):
+                value = io.BytesIO(value)
+            form.add_field(part.name, value, filename=part.filename, content_type=part.content_type)
+        return form, opened
+
+    async def _make_request(self, method, params=None, files=None):
+        limiter = self.rate_limiter
+        if limiter is None or not is_rate_limited(method):
+            return await self._send_request(method, params, files)
+
+        chat_id = params.get('chat_id') if params else None
+        for attempt in range(limiter.max_retries + 1):
+            if chat_id is not None:
+                delay = limiter.reserve(chat_id)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            delay = limiter.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            response = await self._send_request(method, params, files)
+            retry_after = get_retry_after(response)
+            if retry_after is None or attempt == limiter.max_retries:
+                return response
+            limiter.flood_wait(chat_id, retry_after)
+
+    async def _send_request(self, method, params=None, files=None):
+        metrics = self.metrics
+        if metrics is None:
+            return await self._post(method, params, files)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await self._post(method, params, files)
+        finally:
+            metrics.observe_api(self.metrics_label, method, started, result)
+        return result
+
+    async def _post(self, method, params=None, files=None):
+        url = f"{self.api_url}/{method}"
+        session = self._get_session()
+        params, files = split_params(params, files)
+        timeout = self._timeout(method, params, files)
+        if files:
+            form, opened = self._build_form(params, files)
+            try:
+                async with session.post(url, data=form, timeout=timeout) as response:
+                    return serializer.loads(await response.read())
+            finally:
+                for f in opened:
+                    f.close()
+        else:
+            request = session.post(
+                url,
+                data=serializer.dumps(params) if params else None,
+                headers={'Content-Type': 'application/json'},
+                timeout=timeout,
+            )
+        async with request as response:
+            return serializer.loads(await response.read())
+
+    async def _send_media(self, method, field, chat_id, media, kwargs):
+        payload, files, cache_key = self._media_payload(field, chat_id, media, kwargs)
+        response = await self._make_request(method, params=payload, files=files)
+        if cache_key is not None:
+            if files is None and is_file_id_rejected(response):
+                self.file_id_cache.forget(cache_key)
+                payload.pop(field)
+                response = await self._make_request(method, params=payload, files={field: media})
+            self.file_id_cache.remember(cache_key, field, response)
+        return response
+
+    async def iter_file(self, file_id, chunk_size=download.default_chunk_size, offset=0):
+        file_path = download.file_info(await self.get_file(file_id))['file_path']
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        request = self._get_session().get(
+            f"{self.file_url}/{file_path}", headers=headers, timeout=self._timeout('download')
+        )
+        async with request as response:
+            if response.status not in (200, 206):
+                raise download.FileDownloadError(f"downloading {file_path} failed with HTTP {response.status}")
+            if offset and response.status == 200:
+                raise download.FileDownloadError("the file server ignored the requested range")
+            async for chunk in response.content.iter_chunked(chunk_size):
+                yield chunk
+
+    async def download_file(self, file_id, dest=None, file_unique_id=None, chunk_size=download.default_chunk_size,
+                            resume=True):
+        """Coroutine version of Methods.download_file."""
+        cached = download.cached_file(self.download_cache, file_unique_id)
+        if cached is not None:
+            return download.place(cached, dest)
+
+        info = download.file_info(await self.get_file(file_id))
+        cached = download.cached_file(self.download_cache, info['file_unique_id'])
+        if cached is None:
+            path = download.download_path(self.download_cache, dest, info)
+            part_path = f"{path}.part"
+            offset = download.resume_offset(part_path, resume)
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            url = f"{self.file_url}/{info['file_path']}"
+            async with self._get_session().get(url, headers=headers, timeout=self._timeout('download')) as response:
+                mode = download.open_mode(response.status, offset, info['file_path'])
+                if mode is not None:
+                    with open(part_path, mode) as f:
+                        async for chunk in response.content.iter_chunked(chunk_size):
+                            f.write(chunk)
+            cached = download.finish(part_path, path, info.get('file_size'))
+            if not self.download_cache:
+                return cached
+        return download.place(cached, dest, info['file_path'], info['file_unique_id'])
+
+    async def download_files(self, file_ids, dest=None, workers=4, **kwargs):
+        semaphore = asyncio.Semaphore(workers)
+
+        async def fetch(file_id):
+            async with semaphore:
+                try:
+                    return await self.download_file(file_id, dest, **kwargs)
+                except Exception as e:
+                    return e
+
+        file_ids = list(file_ids)
+        return dict(zip(file_ids, await asyncio.gather(*(fetch(file_id) for file_id in file_ids))))
+
+    async def close_session(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+class AsyncBot(AsyncMethods, Dispatcher):
+    """
+    asyncio counterpart of Bot with the same handler decorators.
+
+    Handlers may be plain functions or coroutine functions. Polled updates run
+    as separate tasks, at most max_concurrent_updates unfinished at a time; updates from
+    the same chat are chained so they still run in order.
+
+    With an update_store (see offsets.MemoryUpdateStore) polling resumes from the
+    stored offset and updates delivered twice are handled once.
+    """
+
+    batcher_class = AsyncUpdateBatcher
+
+    def __init__(self, token, name=None, lazy_updates=False, connection_limit=100, max_concurrent_updates=1000,
+                 rate_limiter=None, log_sample_rate=1.0, metrics=None, file_id_cache=None, download_cache=None,
+                 update_store=None, state_storage=None, transport=None):
+        AsyncMethods.__init__(
+            self, token, connection_limit=connection_limit, rate_limiter=rate_limiter, metrics=metrics,
+            transport=transport,
+            file_id_cache=file_id_cache, download_cache=download_cache,
+        )
+        Dispatcher.__init__(self, state_storage)
+        self.name = name
+        if name:
+            self.metrics_label = name
+        self.lazy_updates = lazy_updates
+        self.max_concurrent_updates = max_concurrent_updates
+        self.me = None
+        self._chat_tasks = {}
+        self._semaphore = None
+        self._in_flight = 0
+        if self.metrics is not None:
+            self.metrics.queue_depth.set_function(self.metrics_label, function=lambda: self._in_flight)
+        self.update_log = UpdateLog(log_sample_rate)
+        self.update_store = update_store
+
+    def extract_main_key(self, data):
+        for key in data.keys():
+            if isinstance(data[key], dict):
+                return key
+        return None
+
+    async def process_update(self, update):
+        started = self.update_log.start()
+        update_type = self.extract_main_key(update)
+        if self.batch_handlers:
+            self.feed_batches(update_type, update)
+        handlers = await self.process_new_updates(update_type, update[update_type])
+        if started is not None:
+            self.update_log.record(started, update, update_type, handlers)
+
+    async def process_new_updates(self, update_type, data):
+        data = to_view(update_type, data) if self.lazy_updates else to_namedtuple(update_type, data)
+        middlewares = self._middlewares_by_type.get(update_type)
+        metrics = self.metrics
+        if middlewares or metrics is not None:
+            return await self._run_pipeline(update_type, data, middlewares or (), metrics)
+        handlers = self.find_handlers(update_type, data)
+        context = {'handlers': handlers}
+        for handler in handlers:
+            result = handler.call(data, context)
+            if inspect.isawaitable(result):
+                await result
+        return handlers
+
+    async def _run_pipeline(self, update_type, data, middlewares, metrics):
+        context = {'handlers': []}
+        handlers = []
+        ran = []
+        try:
+            for middleware in middlewares:
+                proceed = await self._run_hook(middleware, 'pre', update_type, data, context, metrics)
+                ran.append(middleware)
+                if proceed is False:
+                    return handlers
+
+            started = time.perf_counter()
+            handlers = context['handlers'] = self.find_handlers(update_type, data)
+            found = time.perf_counter()
+            if metrics is not None:
+                metrics.updates.inc(self.metrics_label, update_type)
+                metrics.filter_duration.observe(self.metrics_label, update_type, value=found - started)
+            for handler in handlers:
+                name = handler_name(handler) if metrics is not None else None
+                started = time.perf_counter()
+                try:
+                    result = handler.call(data, context)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception:
+                    if metrics is not None:
+                        metrics.handler_errors.inc(self.metrics_label, update_type, name)
+                    raise
+                finally:
+                    if metrics is not None:
+                        metrics.handler_duration.observe(
+                            self.metrics_label, update_type, name, value=time.perf_counter() - started
+                        )
+            return handlers
+        except Exception as e:
+            context['error'] = e
+            raise
+        finally:
+            for middleware in reversed(ran):
+                try:
+                    await self._run_hook(middleware, 'post', update_type, data, context, metrics)
+                except Exception:
+                    logger.exception("Error in post hook of middleware %s", middleware_name(middleware))
+
+    async def _run_hook(self, middleware, stage, update_type, data, context, metrics):
+        hook = getattr(middleware, stage)
+        if hook is None:
+            return None
+        started = time.perf_counter()
+        try:
+            result = hook(update_type, data, context)
+            if inspect.isawaitable(result):
+                result = await result
+            return result
+        finally:
+            if metrics is not None:
+                metrics.middleware_duration.observe(
+                    self.metrics_label, update_type, middleware_name(middleware), stage,
+                    value=time.perf_counter() - started,
+                )
+
+    async def get_me(self):
+        response = await self._make_request('getMe')
+        if response["ok"]:
+            self.me = to_namedtuple("BotInfo", response['result'])
+            return self.me
+        else:
+            raise Exception("INVALID BOT TOKEN")
+
+    async def _run_in_order(self, key, previous, update, semaphore):
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            await self.process_update(update)
+        except Exception:
+            logger.exception("Error while processing update %s", update.get('update_id'))
+        finally:
+            self._in_flight -= 1
+            semaphore.release()
+            if self._chat_tasks.get(key) is asyncio.current_task():
+                del self._chat_tasks[key]
+
+    async def _schedule(self, update, semaphore):
+        # Waiting here caps the number of unfinished updates, so the poller
+        # stops fetching while handlers are behind.
+        await semaphore.acquire()
+        self._in_flight += 1
+        update_type = self.extract_main_key(update)
+        key = get_update_key(update_type, update[update_type])
+        task = asyncio.ensure_future(self._run_in_order(key, self._chat_tasks.get(key), update, semaphore))
+        self._chat_tasks[key] = task
+        return task
+
+    def _get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_updates)
+        return self._semaphore
+
+    async def feed_update(self, update):
+        """
+        Schedules a raw update (e.g. from a webhook) and returns once it is queued,
+        without waiting for its handler. Updates the update_store has already seen
+        are dropped.
+        """
+        store = self.update_store
+        if store is not None and store.seen(update['update_id']):
+            logger.debug("Skipping duplicate update %s", update['update_id'])
+            return
+        await self._schedule(update, self._get_semaphore())
+
+    async def infinity_polling(self, timeout=100, max_backoff=60):
+        """
+        Polls getUpdates forever. The next long-poll request is started as soon
+        as a batch arrives, and only failed polls wait before retrying.
+
+        With an update_store the next request is only sent once the handlers of
+        the batch finished and the offset is committed, so delivery is
+        at-least-once (see Bot.infinity_polling).
+        """
+        semaphore = self._get_semaphore()
+        store = self.update_store
+        offset = store.offset if store is not None else 0
+        errors = 0
+        pending = asyncio.ensure_future(self.get_updates(offset=offset, timeout=timeout))
+        try:
+            while True:
+                try:
+                    updates = await pending
+                    if not updates['ok']:
+                        raise TelegramPollingError(updates)
+                except Exception as e:
+                    logger.warning("getUpdates failed: %s", e)
+                    errors += 1
+                    await asyncio.sleep(polling_backoff(errors, e, max_backoff))
+                    pending = asyncio.ensure_future(self.get_updates(offset=offset, timeout=timeout))
+                    continue
+
+                errors = 0
+                batch = updates['result']
+                logger.debug("Received %d updates: %s", len(batch), batch)
+                for update in batch:
+                    offset = max(offset, update['update_id'] + 1)
+                if store is None:
+                    pending = asyncio.ensure_future(self.get_updates(offset=offset, timeout=timeout))
+                    for update in batch:
+                        await self._schedule(update, semaphore)
+                    continue
+
+                # The next request confirms this batch, so wait for its handlers
+                # and commit first.
+                tasks = []
+                accepted = set()
+                for update in batch:
+                    update_id = update['update_id']
+                    if update_id in store or update_id in accepted:
+                        logger.debug("Skipping duplicate update %s", update_id)
+                        continue
+                    accepted.add(update_id)
+                    tasks.append(await self._schedule(update, semaphore))
+                if batch:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                    await self._flush_batches()
+                    store.commit(offset)
+                pending = asyncio.ensure_future(self.get_updates(offset=offset, timeout=timeout))
+        finally:
+            pending.cancel()
+            await self.drain()
+            await self.close_session()
+
+    async def drain(self):
+        """
+        Waits until every scheduled update has been handled and hands partly
+        filled batches to their batch handlers, waiting for those too. Call it
+        before close_session when shutting down, as infinity_polling does.
+        """
+        # The last task of a chat waits for the earlier ones, and batches are
+        # fed from these tasks, so they go first.
+        await asyncio.gather(*self._chat_tasks.values(), return_exceptions=True)
+        await self._flush_batches()
+
+    async def _flush_batches(self):
+        # Hands partly filled batches over and waits for their handlers.
+        self.flush_batches()
+        tasks = set()
+        for batchers in self.batch_handlers.values():
+            for batcher in batchers:
+                tasks.update(batcher.tasks)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self):
+        logger.info("Running with polling (infinity mode)")
+        asyncio.run(self.infinity_polling())
@@ -0,0 +1,122 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+
+from .log import handler_name, logger
+
+
+class UpdateBatcher:
+    """
+    Collects updates for a batch handler and calls it with a list of them.
+
+    A batch is handed over when it reaches max_size, or max_wait seconds after
+    its first update arrived, whichever comes first. Full batches are handled on
+    the thread that completed them; batches closed by max_wait on a timer thread
+    started on first use (and again after a fork).
+
+    Parameters:
+        callback (callable): Receives a list of converted updates.
+        convert (callable): Turns a raw update dict into what callback receives.
+        max_size (int): Largest batch passed to callback.
+        max_wait (float): Longest time in seconds an update waits for its batch.
+    """
+
+    def __init__(self, callback, convert, max_size=100, max_wait=1.0):
+        self.callback = callback
+        self.convert = convert
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.items = []
+        self.deadline = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+
+    def _ensure_timer(self):
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._timer, name=f"TGramBot-batch-{handler_name(self)}", daemon=True
+            )
+            self._thread.start()
+
+    def _timer(self):
+        while True:
+            with self._lock:
+                while self.deadline is None:
+                    self._wakeup.wait()
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self._wakeup.wait(remaining)
+                    continue
+                batch = self._take()
+            self._run(batch)
+
+    def _take(self):
+        batch, self.items, self.deadline = self.items, [], None
+        return batch
+
+    def add(self, update):
+        with self._lock:
+            self._ensure_timer()
+            self.items.append(update)
+            if len(self.items) < self.max_size:
+                if self.deadline is None:
+                    self.deadline = time.monotonic() + self.max_wait
+                    self._wakeup.notify()
+                return
+            batch = self._take()
+        self._run(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        self._run(batch)
+
+    def _run(self, batch):
+        if not batch:
+            return
+        try:
+            self.callback([self.convert(update) for update in batch])
+        except Exception:
+            logger.exception("Error in batch handler %s", handler_name(self))
+
+
+class AsyncUpdateBatcher(UpdateBatcher):
+    """
+    UpdateBatcher for AsyncBot: the max_wait timer is a loop callback and the
+    handler, which may be a coroutine function, runs as a task.
+    """
+
+    def __init__(self, callback, convert, max_size=100, max_wait=1.0):
+        super().__init__(callback, convert, max_size, max_wait)
+        self._handle = None
+        self.tasks = set()
+
+    def add(self, update):
+        self.items.append(update)
+        if len(self.items) >= self.max_size:
+            self.flush()
+        elif self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        batch, self.items = self.items, []
+        if batch:
+            task = asyncio.ensure_future(self._run_async(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run_async(self, batch):
+        try:
+            result = self.callback([self.convert(update) for update in batch])
+            if inspect.isawaitable(result):
+                await result
+        except Exception:
+            logger.exception("Error in batch handler %s", handler_name(self))
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+
+from .ratelimit import RateLimiter
+
+# Statuses that are final; recipients with any other status are retried on resume.
+final_statuses = ('sent', 'blocked', 'deactivated', 'forbidden', 'not_found', 'failed')
+
+
+def classify_response(response):
+    if not isinstance(response, dict):
+        return 'failed'
+    if response.get('ok'):
+        return 'sent'
+    code = response.get('error_code')
+    description = (response.get('description') or '').lower()
+    if code == 403:
+        if 'blocked' in description:
+            return 'blocked'
+        if 'deactivated' in description:
+            return 'deactivated'
+        return 'forbidden'
+    if code == 400 and 'not found' in description:
+        return 'not_found'
+    if code == 429:
+        return 'rate_limited'
+    return 'failed'
+
+
+class BroadcastStats:
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.skipped = 0
+        self.counts = {}
+        self.started = time.monotonic()
+        self.finished = None
+
+    def add(self, status):
+        self.done += 1
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        rate = self.rate
+        if self.total is None or not rate:
+            return None
+        return max(0, self.total - self.skipped - self.done) / rate
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'done': self.done,
+            'skipped': self.skipped,
+            'counts': dict(self.counts),
+            'elapsed': self.elapsed,
+            'rate': self.rate,
+            'eta': self.eta,
+        }
+
+    def __repr__(self):
+        return f"BroadcastStats({self.as_dict()})"
+
+
+class Broadcast:
+    """
+    Sends one message to many chats with send_message, copy_message,
+    forward_message or any other method that takes chat_id first.
+
+    Sends run on `workers` threads and go through the bot's rate limiter (if
+    the bot has none, one is attached while run() is in progress and removed
+    afterwards), so flood-wait errors are retried instead of failing
+    recipients. Each recipient's outcome is stored in
+    `results` and, when `checkpoint` is a file path, appended to it as a JSON
+    line. Running again with the same checkpoint skips recipients that
+    already reached a final status, so an interrupted broadcast resumes where
+    it stopped.
+
+    Parameters:
+        bot (Bot): The bot to send with.
+        chat_ids (iterable): Recipients. May be a generator.
+        method (str): Name of the bot method, e.g. 'send_message' or 'copy_message'.
+        args (tuple): Positional arguments passed after chat_id.
+        kwargs (dict): Keyword arguments for the method.
+        workers (int): Number of concurrent senders.
+        checkpoint (str): Path of the JSON lines file used to record and resume progress.
+        on_progress (callable): Called with BroadcastStats every progress_interval seconds
+            and once at the end.
+        progress_interval (float): Seconds between on_progress calls.
+    """
+
+    def __init__(self, bot, chat_ids, method='send_message', args=(), kwargs=None, workers=16, checkpoint=None,
+                 on_progress=None, progress_interval=5):
+        self.bot = bot
+        # Kept across runs so a resumed broadcast continues with the same budget.
+        self.rate_limiter = RateLimiter()
+        self.chat_ids = chat_ids
+        self.send = getattr(bot, method)
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.workers = workers
+        self.checkpoint = checkpoint
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.results = {}
+        self.stats = BroadcastStats(len(chat_ids) if hasattr(chat_ids, '__len__') else None)
+        self._lock = threading.Lock()
+        self._checkpoint_file = None
+        self._stopped = threading.Event()
+
+    def _load_checkpoint(self):
+        done = {}
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            with open(self.checkpoint, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short by a crash
+                    if record.get('status') in final_statuses:
+                        done[str(record['chat_id'])] = record['status']
+        return done
+
+    def _record(self, chat_id, status, response):
+        with self._lock:
+            self.results[chat_id] = status
+            self.stats.add(status)
+            if self._checkpoint_file is not None:
+                record = {'chat_id': chat_id, 'status': status}
+                if status != 'sent' and isinstance(response, dict):
+                    record['description'] = response.get('description')
+                self._checkpoint_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._checkpoint_file.flush()
+
+    def _worker(self, recipients):
+        while not self._stopped.is_set():
+            with self._lock:
+                chat_id = next(recipients, None)
+            if chat_id is None:
+                return
+            try:
+                response = self.send(chat_id, *self.args, **self.kwargs)
+                status = classify_response(response)
+            except Exception as e:
+                response = {'description': str(e)}
+                status = 'error'
+            self._record(chat_id, status, response)
+
+    def _report(self):
+        while not self._stopped.wait(self.progress_interval):
+            self.on_progress(self.stats)
+
+    def _pending(self, done):
+        for chat_id in self.chat_ids:
+            if str(chat_id) in done:
+                self.stats.skipped += 1
+                continue
+            yield chat_id
+
+    def run(self):
+        self._stopped.clear()
+        attached = self.bot.rate_limiter is None
+        if attached:
+            self.bot.rate_limiter = self.rate_limiter
+        done = self._load_checkpoint()
+        recipients = self._pending(done)
+        if self.checkpoint:
+            self._checkpoint_file = open(self.checkpoint, 'a', encoding='utf-8')
+        threads = [threading.Thread(target=self._worker, args=(recipients,), daemon=True) for _ in range(self.workers)]
+        reporter = None
+        if self.on_progress is not None:
+            reporter = threading.Thread(target=self._report, daemon=True)
+            reporter.start()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self._stopped.set()
+            if attached and self.bot.rate_limiter is self.rate_limiter:
+                self.bot.rate_limiter = None
+            self.stats.finished = time.monotonic()
+            if self._checkpoint_file is not None:
+                self._checkpoint_file.close()
+                self._checkpoint_file = None
+            if reporter is not None:
+                reporter.join()
+                self.on_progress(self.stats)
+        return self.stats
+
+    def stop(self):
+        """Stops after the sends already in progress; run() can be called again to resume."""
+        self._stopped.set()
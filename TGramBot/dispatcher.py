@@ -0,0 +1,480 @@
+import inspect
+import re
+from heapq import merge
+
+from .batching import UpdateBatcher
+from .filters import as_filter
+from .log import handler_name, logger
+from .middleware import FunctionMiddleware
+from .state import MemoryStateStorage, State
+from .utils import content_type_media, content_type_service, to_namedtuple, to_view, update_types
+
+message_update_types = (
+    "message", "edited_message", "channel_post", "edited_channel_post", "business_message", "edited_business_message",
+)
+
+content_types = content_type_media + content_type_service
+
+text_fields = {
+    "callback_query": ("data",),
+    "inline_query": ("query",),
+    "chosen_inline_result": ("query",),
+}
+
+
+def _as_set(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return frozenset((value,))
+    return frozenset(value)
+
+
+_unset = object()
+
+
+def _accepts_context(callback):
+    try:
+        return 'context' in inspect.signature(callback).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def get_state_ids(data):
+    """(chat_id, user_id) of a message or callback/inline query, for state lookups."""
+    chat = getattr(data, 'chat', None)
+    if chat is None:
+        chat = getattr(getattr(data, 'message', None), 'chat', None)
+    user = getattr(data, 'from_user', None)
+    chat_id = getattr(chat, 'id', None)
+    user_id = getattr(user, 'id', None)
+    return (chat_id if chat_id is not None else user_id), (user_id if user_id is not None else chat_id)
+
+
+def get_text(update_type, data):
+    """
+    Returns the text that regexp and prefix rules match against: text or caption
+    for messages, data for callback queries and query for inline queries.
+    """
+    for field in text_fields.get(update_type, ("text", "caption")):
+        value = getattr(data, field, None)
+        if value is not None:
+            return value
+    return None
+
+
+def get_command(text):
+    if not text or text[0] != '/':
+        return None
+    return text.split(None, 1)[0][1:].split('@', 1)[0]
+
+
+def get_content_type(data):
+    for content_type in content_types:
+        if getattr(data, content_type, None) is not None:
+            return content_type
+    return None
+
+
+class Handler:
+    def __init__(self, callback, filter_func=None, commands=None, content_types=None, regexp=None, prefix=None,
+                 state=None, group=0):
+        self.callback = callback
+        self.filter_func = filter_func
+        # Plain functions become Predicates so their results are shared per update too.
+        self.filter = as_filter(filter_func) if filter_func is not None else None
+        self.commands = _as_set(commands)
+        self.content_types = _as_set(content_types)
+        self.regexp = re.compile(regexp) if isinstance(regexp, str) else regexp
+        self.prefix = prefix
+        self.states = _as_set(state)
+        self.group = group
+        self.order = None
+        self.wants_context = _accepts_context(callback)
+
+    def call(self, data, context):
+        if self.wants_context:
+            return self.callback(data, context=context)
+        return self.callback(data)
+
+    def check(self, data, text, command, content_type, memo=None):
+        if self.commands is not None and command not in self.commands:
+            return False
+        if self.content_types is not None and content_type not in self.content_types:
+            return False
+        if self.prefix is not None and (text is None or not text.startswith(self.prefix)):
+            return False
+        if self.regexp is not None and (text is None or not self.regexp.search(text)):
+            return False
+        if self.filter is None:
+            return True
+        return self.filter.evaluate(data, {} if memo is None else memo)
+
+    def __iter__(self):
+        # Unpacks like the (filter_func, handler) tuples handlers used to be stored as.
+        return iter((self.filter_func, self.callback))
+
+
+class HandlerIndex:
+    """
+    Handlers of one update type, indexed by command, callback/inline prefix and
+    content type.
+
+    Each handler is stored under one key: its commands if it has any, else its
+    prefix, else its content types. Handlers with none of these only have a
+    filter_func or regexp and are tried for every update. Lookups return the
+    candidates in registration order, so the first matching handler still wins.
+    Every handler group has its own index.
+    """
+
+    def __init__(self, update_type, group=0):
+        self.update_type = update_type
+        self.group = group
+        self.handlers = []
+        self.by_command = {}
+        self.by_content_type = {}
+        self.prefix_trie = {}
+        self.unindexed = []
+        # Any handler checks content_types, including ones indexed by command or prefix.
+        self.uses_content_type = False
+
+    def add(self, handler):
+        handler.order = len(self.handlers)
+        self.handlers.append(handler)
+        if handler.content_types is not None:
+            self.uses_content_type = True
+        if handler.commands is not None:
+            for command in handler.commands:
+                self.by_command.setdefault(command, []).append(handler)
+        elif handler.prefix is not None:
+            node = self.prefix_trie
+            for char in handler.prefix:
+                node = node.setdefault(char, {})
+            node.setdefault(None, []).append(handler)
+        elif handler.content_types is not None:
+            for content_type in handler.content_types:
+                self.by_content_type.setdefault(content_type, []).append(handler)
+        else:
+            self.unindexed.append(handler)
+
+    def _prefix_matches(self, text, found):
+        node = self.prefix_trie
+        if None in node:
+            found.append(node[None])
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+
+    def candidates(self, text, command, content_type):
+        found = []
+        if command is not None and self.by_command:
+            handlers = self.by_command.get(command)
+            if handlers:
+                found.append(handlers)
+        if text is not None and self.prefix_trie:
+            self._prefix_matches(text, found)
+        if content_type is not None and self.by_content_type:
+            handlers = self.by_content_type.get(content_type)
+            if handlers:
+                found.append(handlers)
+        if self.unindexed:
+            found.append(self.unindexed)
+        if len(found) == 1:
+            return found[0]
+        return merge(*found, key=lambda handler: handler.order)
+
+    def __iter__(self):
+        return iter(self.handlers)
+
+    def __len__(self):
+        return len(self.handlers)
+
+
+class HandlerGroups:
+    """
+    Handlers of one update type across all handler groups: one HandlerIndex per
+    group, ordered by group. Iterating and len() cover the handlers themselves,
+    so `for filter_func, handler in bot.handlers['message']` keeps working.
+    """
+
+    def __init__(self, update_type):
+        self.update_type = update_type
+        self.indexes = [HandlerIndex(update_type)]
+
+    def index(self, group):
+        for index in self.indexes:
+            if index.group == group:
+                return index
+        index = HandlerIndex(self.update_type, group)
+        self.indexes.append(index)
+        self.indexes.sort(key=lambda index: index.group)
+        return index
+
+    def __iter__(self):
+        for index in self.indexes:
+            yield from index
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes)
+
+
+class Dispatcher:
+    batcher_class = UpdateBatcher
+
+    def __init__(self, state_storage=None):
+        self.handlers = {update_type: HandlerGroups(update_type) for update_type in update_types}
+        self.batch_handlers = {}
+        self.middlewares = []
+        self._middlewares_by_type = {}
+        self.state_storage = state_storage if state_storage is not None else MemoryStateStorage()
+
+    def state(self, chat_id, user_id):
+        """Conversation state of user_id in chat_id, see state.State."""
+        return State(self.state_storage, chat_id, user_id)
+
+    def get_state(self, data):
+        chat_id, user_id = get_state_ids(data)
+        if chat_id is None:
+            return None
+        return self.state(chat_id, user_id).get()
+
+    def add_handler(self, update_type, callback, filter_func=None, group=0, **options):
+        """
+        Registers callback for update_type. Within a group the first matching
+        handler wins; every group gets its own match, and groups run in
+        ascending order, so e.g. a group=-1 logging handler and a group=0 reply
+        handler both see the same message.
+        """
+        handler = Handler(callback, filter_func, group=group, **options)
+        self.handlers[update_type].index(group).add(handler)
+        return handler
+
+    def add_middleware(self, middleware, update_types=None):
+        """
+        Runs middleware (see middleware.Middleware) around the handlers of
+        update_types, or of every update when update_types is None. Middlewares
+        run in the order they were added; post hooks in reverse.
+        """
+        if isinstance(update_types, str):
+            update_types = [update_types]
+        self.middlewares.append((middleware, frozenset(update_types) if update_types else None))
+        self._middlewares_by_type = {
+            update_type: [m for m, types in self.middlewares if types is None or update_type in types]
+            for update_type in self.handlers
+        }
+        return middleware
+
+    def before_update(self, update_types=None):
+        """Decorator form of add_middleware for a pre(update_type, data, context) function."""
+        def decorator(func):
+            self.add_middleware(FunctionMiddleware(pre=func), update_types)
+            return func
+        return decorator
+
+    def after_update(self, update_types=None):
+        """Decorator form of add_middleware for a post(update_type, data, context) function."""
+        def decorator(func):
+            self.add_middleware(FunctionMiddleware(post=func), update_types)
+            return func
+        return decorator
+
+    def _handler_decorator(self, update_type, filter_func=None, **options):
+        def decorator(func):
+            self.add_handler(update_type, func, filter_func, **options)
+            return func
+        return decorator
+
+    def convert_update(self, update):
+        """A whole raw update as passed to batch handlers, e.g. update.update_id, update.message."""
+        if getattr(self, 'lazy_updates', False):
+            return to_view('update', update)
+        return to_namedtuple('update', update)
+
+    def add_batch_handler(self, callback, update_types=None, max_size=100, max_wait=1.0):
+        batcher = self.batcher_class(callback, self.convert_update, max_size, max_wait)
+        for update_type in update_types or self.handlers:
+            self.batch_handlers.setdefault(update_type, []).append(batcher)
+        return batcher
+
+    def batch_handler(self, update_types=None, max_size=100, max_wait=1.0):
+        """
+        Registers a handler that receives lists of updates instead of one update
+        at a time, e.g. to store a whole batch with one database round trip.
+
+        Batch handlers see every update of update_types (all types by default)
+        in addition to the regular handlers. A list is passed on once it holds
+        max_size updates or its oldest update has waited max_wait seconds, so
+        polled batches and webhook deliveries alike are grouped with bounded
+        delay. The items are whole updates (update.update_id, update.message, ...).
+
+        Usage:
+            @bot.batch_handler(update_types=['message'], max_size=100, max_wait=2)
+            def store(updates):
+                db.insert_many(update.message for update in updates)
+        """
+        if isinstance(update_types, str):
+            update_types = [update_types]
+
+        def decorator(func):
+            self.add_batch_handler(func, update_types, max_size, max_wait)
+            return func
+        return decorator
+
+    def feed_batches(self, update_type, update):
+        for batcher in self.batch_handlers.get(update_type, ()):
+            batcher.add(update)
+
+    def flush_batches(self):
+        """Hands every partly filled batch to its handler now."""
+        flushed = set()
+        for batchers in self.batch_handlers.values():
+            for batcher in batchers:
+                if id(batcher) not in flushed:
+                    flushed.add(id(batcher))
+                    batcher.flush()
+
+    def find_handlers(self, update_type, data):
+        """The first matching handler of every handler group, in group order."""
+        groups = self.handlers.get(update_type)
+        if not groups:
+            return []
+        indexes = groups.indexes
+
+        text = get_text(update_type, data)
+        command = None
+        content_type = None
+        if update_type in message_update_types:
+            command = get_command(getattr(data, 'text', None))
+            if any(index.uses_content_type for index in indexes):
+                content_type = get_content_type(data)
+
+        found = []
+        state = _unset
+        # Filter results of this update, shared by every handler that uses the same filter.
+        memo = {}
+        for index in indexes:
+            for handler in index.candidates(text, command, content_type):
+                if handler.states is not None:
+                    # Looked up once per update, and only when a candidate filters on state.
+                    if state is _unset:
+                        state = self.get_state(data)
+                    if state not in handler.states:
+                        continue
+                try:
+                    matched = handler.check(data, text, command, content_type, memo)
+                except Exception:
+                    self._filter_failed(update_type, handler)
+                    continue
+                if matched:
+                    found.append(handler)
+                    break
+        return found
+
+    def find_handler(self, update_type, data):
+        handlers = self.find_handlers(update_type, data)
+        return handlers[0] if handlers else None
+
+    def _filter_failed(self, update_type, handler):
+        name = handler_name(handler)
+        logger.exception("Filter of handler %s raised for a %s update; skipping the handler", name, update_type)
+        metrics = getattr(self, 'metrics', None)
+        if metrics is not None:
+            metrics.filter_errors.inc(self.metrics_label, update_type, name)
+
+    def message_handler(self, filter_func=None, commands=None, content_types=None, regexp=None, state=None, group=0):
+        return self._handler_decorator(
+            "message", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def edited_message_handler(self, filter_func=None, commands=None, content_types=None, regexp=None,
+                               state=None, group=0):
+        return self._handler_decorator(
+            "edited_message", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def channel_post_handler(self, filter_func=None, commands=None, content_types=None, regexp=None,
+                             state=None, group=0):
+        return self._handler_decorator(
+            "channel_post", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def edited_channel_post_handler(self, filter_func=None, commands=None, content_types=None, regexp=None,
+                                    state=None, group=0):
+        return self._handler_decorator(
+            "edited_channel_post", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def inline_query_handler(self, filter_func=None, prefix=None, regexp=None, state=None, group=0):
+        return self._handler_decorator(
+            "inline_query", filter_func, prefix=prefix, regexp=regexp, state=state, group=group
+        )
+
+    def chosen_inline_result_handler(self, filter_func=None, prefix=None, regexp=None, state=None, group=0):
+        return self._handler_decorator(
+            "chosen_inline_result", filter_func, prefix=prefix, regexp=regexp, state=state, group=group
+        )
+
+    def callback_query_handler(self, filter_func=None, prefix=None, regexp=None, state=None, group=0):
+        return self._handler_decorator(
+            "callback_query", filter_func, prefix=prefix, regexp=regexp, state=state, group=group
+        )
+
+    def shipping_query_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("shipping_query", filter_func, group=group)
+
+    def pre_checkout_query_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("pre_checkout_query", filter_func, group=group)
+
+    def poll_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("poll", filter_func, group=group)
+
+    def poll_answer_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("poll_answer", filter_func, group=group)
+
+    def my_chat_member_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("my_chat_member", filter_func, group=group)
+
+    def chat_member_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("chat_member", filter_func, group=group)
+
+    def chat_join_request_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("chat_join_request", filter_func, group=group)
+
+    def message_reaction_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("message_reaction", filter_func, group=group)
+
+    def message_reaction_count_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("message_reaction_count", filter_func, group=group)
+
+    def chat_boost_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("chat_boost", filter_func, group=group)
+
+    def removed_chat_boost_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("removed_chat_boost", filter_func, group=group)
+
+    def business_connection_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("business_connection", filter_func, group=group)
+
+    def business_message_handler(self, filter_func=None, commands=None, content_types=None, regexp=None,
+                                 state=None, group=0):
+        return self._handler_decorator(
+            "business_message", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def edited_business_message_handler(self, filter_func=None, commands=None, content_types=None, regexp=None,
+                                        state=None, group=0):
+        return self._handler_decorator(
+            "edited_business_message", filter_func, commands=commands, content_types=content_types, regexp=regexp,
+            state=state, group=group,
+        )
+
+    def deleted_business_messages_handler(self, filter_func=None, group=0):
+        return self._handler_decorator("deleted_business_messages", filter_func, group=group)
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+default_chunk_size = 256 * 1024
+
+
+class FileDownloadError(Exception):
+    pass
+
+
+def file_info(response):
+    """Returns the File object from a getFile response or raises FileDownloadError."""
+    if not isinstance(response, dict) or not response.get('ok'):
+        description = response.get('description') if isinstance(response, dict) else None
+        raise FileDownloadError(description or 'getFile failed')
+    info = response['result']
+    if not info.get('file_path'):
+        raise FileDownloadError(f"file {info.get('file_unique_id')} is not available for download")
+    return info
+
+
+def cached_file(cache_dir, file_unique_id):
+    if not cache_dir or not file_unique_id:
+        return None
+    path = os.path.join(cache_dir, file_unique_id)
+    return path if os.path.isfile(path) else None
+
+
+def download_path(cache_dir, dest, info):
+    """Where the bytes are written: the cache when there is one, else dest."""
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        return os.path.join(cache_dir, info['file_unique_id'])
+    return destination(dest, info.get('file_path'), info['file_unique_id'])
+
+
+def destination(dest, file_path, file_unique_id):
+    name = os.path.basename(file_path) if file_path else file_unique_id
+    if dest is None:
+        return name
+    if os.path.isdir(dest):
+        return os.path.join(dest, name)
+    return os.fspath(dest)
+
+
+def place(path, dest, file_path=None, file_unique_id=None):
+    """Copies a cached file to dest (when given) and returns the final path."""
+    if dest is None:
+        return path
+    target = destination(dest, file_path, file_unique_id or os.path.basename(path))
+    if os.path.abspath(target) != os.path.abspath(path):
+        shutil.copyfile(path, target)
+    return target
+
+
+def resume_offset(part_path, resume):
+    if resume and os.path.exists(part_path):
+        return os.path.getsize(part_path)
+    return 0
+
+
+def open_mode(status, offset, url_path):
+    """
+    Picks how to write the body of a (possibly ranged) download response, or
+    None when a previous attempt already fetched everything.
+    """
+    if status == 206 and offset:
+        return 'ab'
+    if status == 200:
+        return 'wb'
+    if status == 416 and offset:
+        return None
+    raise FileDownloadError(f"downloading {url_path} failed with HTTP {status}")
+
+
+def finish(part_path, path, expected_size):
+    size = os.path.getsize(part_path)
+    if expected_size and size != expected_size:
+        raise FileDownloadError(f"downloaded {size} bytes, expected {expected_size}")
+    os.replace(part_path, path)
+    return path
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .multipart import is_file_input
+
+
+class MemoryFileIdStore:
+    """In-process LRU store keeping at most max_entries file_ids."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            file_id = self.entries.get(key)
+            if file_id is not None:
+                self.entries.move_to_end(key)
+            return file_id
+
+    def set(self, key, file_id):
+        with self._lock:
+            self.entries[key] = file_id
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+class SQLiteFileIdStore:
+    """
+    SQLite store that survives restarts. When it grows past max_entries the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids (key TEXT PRIMARY KEY, file_id TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS file_ids_used ON file_ids (used)")
+
+    def get(self, key):
+        with self._lock, self.connection:
+            row = self.connection.execute("SELECT file_id FROM file_ids WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE file_ids SET used = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key, file_id):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id, used) VALUES (?, ?, ?)", (key, file_id, time.time())
+            )
+            count = self.connection.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM file_ids WHERE key IN (SELECT key FROM file_ids ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def delete(self, key):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+
+    def close(self):
+        self.connection.close()
+
+
+def _response_file_id(response, field):
+    if not isinstance(response, dict) or not response.get('ok'):
+        return None
+    result = response.get('result')
+    media = result.get(field) if isinstance(result, dict) else None
+    if isinstance(media, list):
+        # photo comes back as a list of sizes; the last one is the original
+        media = media[-1] if media else None
+    if isinstance(media, dict):
+        return media.get('file_id')
+    return None
+
+
+def is_file_id_rejected(response):
+    """True when Telegram refused a file_id, e.g. 'wrong file identifier'."""
+    if not isinstance(response, dict) or response.get('ok') or response.get('error_code') != 400:
+        return False
+    return 'file' in (response.get('description') or '').lower()
+
+
+class FileIdCache:
+    """
+    Remembers the file_id Telegram returns for an uploaded file, so sending the
+    same file again sends the file_id instead of the bytes.
+
+    Files are keyed by media field plus path, modification time and size for
+    paths and files opened from disk, or by SHA-256 of the content for
+    in-memory bytes. File objects without a path on disk are not cached. The
+    store is pluggable: anything with get/set/delete, e.g. MemoryFileIdStore
+    (the default) or SQLiteFileIdStore.
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else MemoryFileIdStore()
+
+    def key_for(self, field, media):
+        if isinstance(media, tuple):
+            media = media[1]
+        path = None
+        if isinstance(media, os.PathLike):
+            path = os.fspath(media)
+        elif hasattr(media, 'read'):
+            name = getattr(media, 'name', None)
+            if isinstance(name, str) and os.path.isfile(name):
+                path = name
+        if path is not None:
+            stat = os.stat(path)
+            return f"{field}:path:{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}"
+        if isinstance(media, (bytes, bytearray, memoryview)):
+            return f"{field}:sha256:{hashlib.sha256(media).hexdigest()}"
+        return None
+
+    def lookup(self, field, media):
+        """Returns (cache key, cached file_id or None) for a file input."""
+        if not is_file_input(media):
+            return None, None
+        key = self.key_for(field, media)
+        if key is None:
+            return None, None
+        return key, self.store.get(key)
+
+    def remember(self, key, field, response):
+        file_id = _response_file_id(response, field)
+        if file_id is not None:
+            self.store.set(key, file_id)
+
+    def forget(self, key):
+        self.store.delete(key)
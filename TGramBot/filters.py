@@ -0,0 +1,192 @@
+import inspect
+import re
+
+
+class Filter:
+    """
+    Composable handler filter: combine with &, | and ~ and pass as filter_func.
+
+    While an update is dispatched every distinct filter is evaluated at most
+    once; handlers that reference the same filter (or an equal one, such as
+    two regex('^/ban') filters) reuse the first result. Plain filter_func
+    functions are memoized the same way by identity.
+
+    Usage:
+        admins = is_chat_admin(bot)
+
+        @bot.message_handler(filter_func=chat_type('group', 'supergroup') & admins & regex(r'^!ban'))
+        def ban(message): ...
+
+        @bot.message_handler(filter_func=admins & ~regex(r'^!'))
+        def admin_chat(message): ...
+    """
+
+    key = None
+
+    def evaluate(self, data, memo):
+        raise NotImplementedError
+
+    def __call__(self, data):
+        return self.evaluate(data, {})
+
+    def __and__(self, other):
+        return And(self, as_filter(other))
+
+    def __rand__(self, other):
+        return And(as_filter(other), self)
+
+    def __or__(self, other):
+        return Or(self, as_filter(other))
+
+    def __ror__(self, other):
+        return Or(as_filter(other), self)
+
+    def __invert__(self):
+        return Not(self)
+
+    def __eq__(self, other):
+        return isinstance(other, Filter) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+
+class Predicate(Filter):
+    """Filter calling func(data, *args); equal func and args make equal filters."""
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+        try:
+            hash(args)
+            self.key = (func, args)
+        except TypeError:
+            self.key = (func, id(self))
+
+    def evaluate(self, data, memo):
+        key = self.key
+        if key in memo:
+            return memo[key]
+        result = memo[key] = bool(self.func(data, *self.args))
+        return result
+
+    def __repr__(self):
+        name = getattr(self.func, '__qualname__', repr(self.func))
+        return f"{name}({', '.join(map(repr, self.args))})"
+
+
+class And(Filter):
+    def __init__(self, *filters):
+        self.filters = filters
+        self.key = ('and',) + tuple(f.key for f in filters)
+
+    def evaluate(self, data, memo):
+        return all(f.evaluate(data, memo) for f in self.filters)
+
+    def __repr__(self):
+        return '(' + ' & '.join(map(repr, self.filters)) + ')'
+
+
+class Or(Filter):
+    def __init__(self, *filters):
+        self.filters = filters
+        self.key = ('or',) + tuple(f.key for f in filters)
+
+    def evaluate(self, data, memo):
+        return any(f.evaluate(data, memo) for f in self.filters)
+
+    def __repr__(self):
+        return '(' + ' | '.join(map(repr, self.filters)) + ')'
+
+
+class Not(Filter):
+    def __init__(self, filter):
+        self.filter = filter
+        self.key = ('not', filter.key)
+
+    def evaluate(self, data, memo):
+        return not self.filter.evaluate(data, memo)
+
+    def __repr__(self):
+        return f"~{self.filter!r}"
+
+
+def as_filter(value):
+    """Returns value as a Filter, wrapping plain functions in a Predicate."""
+    if isinstance(value, Filter):
+        return value
+    if callable(value):
+        return Predicate(value)
+    raise TypeError(f"filters must be callables or Filter objects, not {type(value).__name__}")
+
+
+def predicate(func):
+    """Decorator turning func(data) into a Filter."""
+    return Predicate(func)
+
+
+def _text(data):
+    text = getattr(data, 'text', None)
+    if text is None:
+        text = getattr(data, 'caption', None)
+    if text is None:
+        # callback queries and inline queries
+        text = getattr(data, 'data', None) or getattr(data, 'query', None)
+    return text
+
+
+_patterns = {}
+
+
+def _regex(data, pattern, flags):
+    compiled = _patterns.get((pattern, flags))
+    if compiled is None:
+        compiled = _patterns[(pattern, flags)] = re.compile(pattern, flags)
+    text = _text(data)
+    return text is not None and compiled.search(text) is not None
+
+
+def regex(pattern, flags=0):
+    """Matches the text, caption, callback data or inline query against pattern."""
+    return Predicate(_regex, pattern, flags)
+
+
+def _chat_type(data, types):
+    chat = getattr(data, 'chat', None) or getattr(getattr(data, 'message', None), 'chat', None)
+    return getattr(chat, 'type', None) in types
+
+
+def chat_type(*types):
+    """Matches updates from chats of the given types, e.g. 'private', 'group'."""
+    return Predicate(_chat_type, frozenset(types))
+
+
+def _from_user(data, user_ids):
+    return getattr(getattr(data, 'from_user', None), 'id', None) in user_ids
+
+
+def from_user(*user_ids):
+    return Predicate(_from_user, frozenset(user_ids))
+
+
+def _is_chat_admin(data, bot):
+    chat = getattr(data, 'chat', None) or getattr(getattr(data, 'message', None), 'chat', None)
+    user = getattr(data, 'from_user', None)
+    if chat is None or user is None:
+        return False
+    response = bot.get_chat_member(chat.id, user.id)
+    if not response.get('ok'):
+        return False
+    return response['result'].get('status') in ('creator', 'administrator')
+
+
+def is_chat_admin(bot):
+    """
+    Matches updates whose sender is an admin of the chat (one getChatMember call per update).
+
+    Filters are evaluated synchronously, so this only works with Bot; with
+    AsyncBot check the member status inside the handler instead.
+    """
+    if inspect.iscoroutinefunction(bot._make_request):
+        raise TypeError("is_chat_admin needs a Bot; filters cannot await AsyncBot API calls")
+    return Predicate(_is_chat_admin, bot)
@@ -0,0 +1,48 @@
+import logging
+import random
+import time
+
+logger = logging.getLogger('TGramBot')
+logger.addHandler(logging.NullHandler())
+
+update_logger = logging.getLogger('TGramBot.updates')
+
+
+def handler_name(handler):
+    if handler is None:
+        return None
+    callback = handler.callback
+    return getattr(callback, '__qualname__', None) or repr(callback)
+
+
+class UpdateLog:
+    """
+    Writes one record per processed update to the 'TGramBot.updates' logger at
+    INFO level. The record carries update_id, update_type, handler (the handlers
+    that ran, comma separated) and latency (seconds) as attributes, for JSON or
+    other structured formatters.
+
+    start() returns None when the logger is disabled for INFO or the update is
+    not in the sample, in which case no timing is done and nothing is built.
+
+    Parameters:
+        sample_rate (float): Fraction of updates to record, from 0 to 1.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+
+    def start(self):
+        if not update_logger.isEnabledFor(logging.INFO):
+            return None
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return None
+        return time.perf_counter()
+
+    def record(self, started, update, update_type, handlers):
+        latency = time.perf_counter() - started
+        name = ', '.join(handler_name(handler) for handler in handlers) or None
+        update_logger.info(
+            "update %s (%s) handled by %s in %.2f ms", update.get('update_id'), update_type, name, latency * 1000,
+            extra={'update_id': update.get('update_id'), 'update_type': update_type, 'handler': name, 'latency': latency},
+        )
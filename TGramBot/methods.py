@@ -1,22 +1,121 @@
-import json
-import urllib3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import download
+from . import metrics as metrics_module
+from . import serializer
+from .file_cache import is_file_id_rejected
+from .multipart import MultipartEncoder, attach_media, split_params
+from .ratelimit import get_retry_after, is_rate_limited
+from .transport import Transport, polling_methods
 
 class Methods:
-    def __init__(self, token):
+    def __init__(self, token, rate_limiter=None, metrics=None, file_id_cache=None, download_cache=None,
+                 transport=None):
         self.token = token
-        self.api_url = f"https://api.telegram.org/bot{self.token}"
-        self.http = urllib3.PoolManager()
+        self.transport = transport if transport is not None else Transport()
+        self.api_url = f"{self.transport.base_url}/bot{self.token}"
+        self.file_url = f"{self.transport.base_url}/file/bot{self.token}"
+        self.download_cache = download_cache
+        self.http = self.transport.pool_manager()
+        self.polling_http = self.transport.polling_pool_manager()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics_module.resolve(metrics)
+        self.metrics_label = token.split(':', 1)[0]
+        self.file_id_cache = file_id_cache
+
+    def reset_connections(self):
+        """Drops pooled HTTP connections, e.g. in a forked worker process."""
+        self.http = self.transport.pool_manager()
+        self.polling_http = self.transport.polling_pool_manager()
 
     def _make_request(self, method, params=None, files=None):
+        limiter = self.rate_limiter
+        if limiter is None or not is_rate_limited(method):
+            return self._send_request(method, params, files)
+
+        chat_id = params.get('chat_id') if params else None
+        for attempt in range(limiter.max_retries + 1):
+            limiter.acquire(chat_id)
+            response = self._send_request(method, params, files)
+            retry_after = get_retry_after(response)
+            if retry_after is None or attempt == limiter.max_retries:
+                return response
+            limiter.flood_wait(chat_id, retry_after)
+
+    def _send_request(self, method, params=None, files=None):
+        metrics = self.metrics
+        if metrics is None:
+            return self._post(method, params, files)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = self._post(method, params, files)
+        finally:
+            metrics.observe_api(self.metrics_label, method, started, result)
+        return result
+
+    def _post(self, method, params=None, files=None):
         url = f"{self.api_url}/{method}"
-        response = self.http.request(
-            'POST',
-            url,
-            body=json.dumps(params) if params else None,
-            headers={'Content-Type': 'application/json'},
-            fields=files
-        )
-        return json.loads(response.data.decode('utf-8'))
+        params, files = split_params(params, files)
+        http = self.polling_http if method in polling_methods else self.http
+        timeout = self.transport.timeout(method, params, files)
+        retries = self.transport.retry(method, files)
+        if files:
+            encoder = MultipartEncoder(params, files)
+            headers = encoder.headers()
+            response = http.request(
+                'POST',
+                url,
+                body=iter(encoder),
+                headers=headers,
+                chunked='Content-Length' not in headers,
+                timeout=timeout,
+                retries=retries,
+            )
+        else:
+            response = http.request(
+                'POST',
+                url,
+                body=serializer.dumps(params) if params else None,
+                headers={'Content-Type': 'application/json'},
+                timeout=timeout,
+                retries=retries,
+            )
+        return serializer.loads(response.data)
+
+    def _media_payload(self, field, chat_id, media, kwargs):
+        """
+        Builds params and files for a send* call with one media field. Local files
+        already uploaded once are replaced by their cached file_id.
+        Returns (payload, files, cache key to record the new file_id under).
+        """
+        payload = {'chat_id': chat_id}
+        files = None
+        cache_key = None
+        if isinstance(media, str):
+            payload[field] = media
+        else:
+            cached = None
+            if self.file_id_cache is not None:
+                cache_key, cached = self.file_id_cache.lookup(field, media)
+            if cached is not None:
+                payload[field] = cached
+            else:
+                files = {field: media}
+        payload.update(kwargs)
+        return payload, files, cache_key
+
+    def _send_media(self, method, field, chat_id, media, kwargs):
+        payload, files, cache_key = self._media_payload(field, chat_id, media, kwargs)
+        response = self._make_request(method, params=payload, files=files)
+        if cache_key is not None:
+            if files is None and is_file_id_rejected(response):
+                self.file_id_cache.forget(cache_key)
+                payload.pop(field)
+                response = self._make_request(method, params=payload, files={field: media})
+            self.file_id_cache.remember(cache_key, field, response)
+        return response
 
     def get_me(self, **kwargs):
         return self._make_request('getMe', params=kwargs)
@@ -49,6 +148,107 @@ class Methods:
         """
         return self._make_request('getFile', params={'file_id': file_id, **kwargs})
 
+    def iter_file(self, file_id, chunk_size=download.default_chunk_size, offset=0):
+        """
+        Streams a file from Telegram's file server in chunks, without writing it
+        to disk.
+
+        Parameters:
+            file_id (str): The file to download.
+            chunk_size (int): Bytes per chunk.
+            offset (int): Byte position to start from.
+
+        Yields:
+            bytes: The file content, chunk by chunk.
+        """
+        file_path = download.file_info(self.get_file(file_id))['file_path']
+        headers = {'Range': f'bytes={offset}-'} if offset else None
+        response = self.http.request(
+            'GET', f"{self.file_url}/{file_path}", headers=headers, preload_content=False,
+            timeout=self.transport.timeout('download'), retries=self.transport.retry('download'),
+        )
+        try:
+            if response.status not in (200, 206):
+                raise download.FileDownloadError(f"downloading {file_path} failed with HTTP {response.status}")
+            if offset and response.status == 200:
+                raise download.FileDownloadError("the file server ignored the requested range")
+            yield from response.stream(chunk_size)
+        finally:
+            response.release_conn()
+
+    def download_file(self, file_id, dest=None, file_unique_id=None, chunk_size=download.default_chunk_size,
+                      resume=True):
+        """
+        Downloads a file straight to disk.
+
+        The body is streamed in chunks into `<target>.part`, which is renamed once
+        complete; if a .part file is left over from an interrupted download the
+        transfer resumes from where it stopped. With `download_cache` set on the
+        bot, files are stored there by file_unique_id and never fetched twice;
+        passing file_unique_id (known from the update) skips even the getFile call
+        on a cache hit.
+
+        Parameters:
+            file_id (str): The file to download.
+            dest (str): Target file or directory. Defaults to the cache path, or the
+                file's own name in the working directory.
+            file_unique_id (str): Optional, allows a cache lookup before getFile.
+            chunk_size (int): Bytes read and written at a time.
+            resume (bool): Continue from a leftover .part file.
+
+        Returns:
+            str: The path of the downloaded file.
+        """
+        cached = download.cached_file(self.download_cache, file_unique_id)
+        if cached is not None:
+            return download.place(cached, dest)
+
+        info = download.file_info(self.get_file(file_id))
+        cached = download.cached_file(self.download_cache, info['file_unique_id'])
+        if cached is None:
+            path = download.download_path(self.download_cache, dest, info)
+            part_path = f"{path}.part"
+            offset = download.resume_offset(part_path, resume)
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            response = self.http.request(
+                'GET', f"{self.file_url}/{info['file_path']}", headers=headers, preload_content=False,
+                timeout=self.transport.timeout('download'), retries=self.transport.retry('download'),
+            )
+            try:
+                mode = download.open_mode(response.status, offset, info['file_path'])
+                if mode is not None:
+                    with open(part_path, mode) as f:
+                        for chunk in response.stream(chunk_size):
+                            f.write(chunk)
+            finally:
+                response.release_conn()
+            cached = download.finish(part_path, path, info.get('file_size'))
+            if not self.download_cache:
+                return cached
+        return download.place(cached, dest, info['file_path'], info['file_unique_id'])
+
+    def download_files(self, file_ids, dest=None, workers=4, **kwargs):
+        """
+        Downloads several files in parallel with download_file.
+
+        Parameters:
+            file_ids (iterable): The files to download.
+            dest (str): Target directory.
+            workers (int): Number of concurrent downloads.
+
+        Returns:
+            dict: file_id -> path, or the exception raised for that file.
+        """
+        def fetch(file_id):
+            try:
+                return self.download_file(file_id, dest, **kwargs)
+            except Exception as e:
+                return e
+
+        file_ids = list(file_ids)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(file_ids, executor.map(fetch, file_ids)))
+
     def send_message(self, chat_id, text, **kwargs):
         """
         Sends a message to a chat.
@@ -404,40 +604,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
     
-        payload = {'chat_id': chat_id}
-        files = None
-        
-        if isinstance(photo, str):
-            payload['photo'] = photo
-        else:
-            files = {'photo': photo}
-    
-        payload.update(kwargs)
-        return self._make_request('sendPhoto', params=payload, files=files)
-
-    def send_photo(chat_id, photo, **kwargs):
-        """
-        Sends a photo to a specified chat.
-        
-        Parameters:
-            chat_id (str): The ID of the chat.
-            photo (str or file): The photo to send.
-            kwargs: Other optional parameters for sending the photo.
-        
-        Returns:
-            Response: The response from the Telegram API.
-        """
-        
-        payload = {'chat_id': chat_id}
-        files = None
-    
-        if isinstance(photo, str):
-            payload['photo'] = photo
-        else:
-            files = {'photo': photo}
-    
-        payload.update(kwargs)
-        return self._make_request('sendPhoto', params=payload, files=files)
+        return self._send_media('sendPhoto', 'photo', chat_id, photo, kwargs)
 
     def send_media_group(self, chat_id, media, **kwargs):
         """
@@ -445,7 +612,10 @@ class Methods:
     
         Parameters:
             chat_id (str): The ID of the target chat.
-            media (list): A list of media files to send.
+            media (list): InputMedia dicts, e.g. {'type': 'photo', 'media': ..., 'caption': ...}.
+                All fields are kept. 'media' and 'thumbnail' may be a file_id/URL or a local
+                file (path, file object or bytes); local files are streamed in the same
+                request as attach:// parts.
             kwargs: disable_notification (bool), timeout (int), protect_content (bool), 
                     message_thread_id (int), reply_parameters (dict), business_connection_id (str),
                     message_effect_id (str).
@@ -454,11 +624,10 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        media_json = [{'type': item['type'], 'media': item['media']} for item in media]
+        media_json, files = attach_media(media)
         payload = {'chat_id': chat_id, 'media': media_json}
         payload.update(kwargs)
-        files = [item['media'] for item in media if isinstance(item['media'], (str, bytes))]
-        return self._make_request('sendMediaGroup', params=payload, files=files or None, method='post' if files else 'get')
+        return self._make_request('sendMediaGroup', params=payload, files=files)
 
     def send_location(self, chat_id, latitude, longitude, **kwargs):
         """
@@ -615,14 +784,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(video, str):
-            payload['video'] = video
-        else:
-            files['video'] = video
-        payload.update(kwargs)
-        return self._make_request('sendVideo', params=payload, files=files)
+        return self._send_media('sendVideo', 'video', chat_id, video, kwargs)
 
     def send_animation(self, chat_id, animation, **kwargs):
         """
@@ -641,14 +803,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(animation, str):
-            payload['animation'] = animation
-        else:
-            files['animation'] = animation
-        payload.update(kwargs)
-        return self._make_request('sendAnimation', params=payload, files=files)
+        return self._send_media('sendAnimation', 'animation', chat_id, animation, kwargs)
 
     def send_voice(self, chat_id, voice, **kwargs):
         """
@@ -666,14 +821,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(voice, str):
-            payload['voice'] = voice
-        else:
-            files['voice'] = voice
-        payload.update(kwargs)
-        return self._make_request('sendVoice', params=payload, files=files)
+        return self._send_media('sendVoice', 'voice', chat_id, voice, kwargs)
 
     def send_video_note(self, chat_id, video_note, **kwargs):
         """
@@ -691,17 +839,9 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(video_note, str):
-            payload['video_note'] = video_note
-        else:
-            files['video_note'] = video_note
-        payload.update(kwargs)
-        return self._make_request('sendVideoNote', params=payload, files=files)
+        return self._send_media('sendVideoNote', 'video_note', chat_id, video_note, kwargs)
 
     def send_audio(self, chat_id, audio, **kwargs):
-        print(kwargs)
         """
         Sends an audio file to a specified chat.
     
@@ -727,15 +867,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
         
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(audio, str):
-            payload['audio'] = audio
-        else:
-            files['audio'] = audio
-
-        payload.update(kwargs)
-        return self._make_request('sendAudio', params=payload, files=files)
+        return self._send_media('sendAudio', 'audio', chat_id, audio, kwargs)
     
     def send_sticker(self, chat_id, sticker, **kwargs):
         """
@@ -754,14 +886,7 @@ class Methods:
             Response: The response from the Telegram API.
         """
     
-        payload = {'chat_id': chat_id}
-        files = {}
-        if isinstance(sticker, str):
-            payload['sticker'] = sticker
-        else:
-            files['sticker'] = sticker
-        payload.update(kwargs)
-        return self._make_request('sendSticker', params=payload, files=files)
+        return self._send_media('sendSticker', 'sticker', chat_id, sticker, kwargs)
     
     def answer_inline_query(self, inline_query_id, results, **kwargs):
         """
@@ -791,7 +916,7 @@ class Methods:
         
         params = {
             'inline_query_id': inline_query_id,
-            'results': json.dumps(results),
+            'results': results,
             **kwargs
         }
         return self._make_request('answerInlineQuery', params=params)
\ No newline at end of file
@@ -0,0 +1,185 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Bot(metrics=True) records into the shared `registry`; pass a Metrics instance
+instead to keep a separate one. Read them with Metrics.render() (Prometheus
+text format), Metrics.snapshot() (plain dicts) or the /metrics route that
+create_app(..., metrics=True) adds.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, _format_labels(self.labels, label_values), value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def __init__(self, name, description, labels=()):
+        super().__init__(name, description, labels)
+        self.functions = {}
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self.values[label_values] = value
+
+    def set_function(self, *label_values, function):
+        """Reads the value from function() whenever the gauge is collected."""
+        with self._lock:
+            self.functions[label_values] = function
+
+    def _collect(self):
+        with self._lock:
+            values = dict(self.values)
+            functions = list(self.functions.items())
+        for label_values, function in functions:
+            try:
+                values[label_values] = function()
+            except Exception:
+                continue
+        return values
+
+    def samples(self):
+        for label_values, value in self._collect().items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+    def snapshot(self):
+        return self._collect()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=default_buckets):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(label_values)
+            if series is None:
+                series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(label_values, list(counts), total, count) for label_values, (counts, total, count) in self.values.items()]
+        for label_values, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _format_labels(self.labels, label_values, f'le="{bound}"'), cumulative
+            yield self.name + '_bucket', _format_labels(self.labels, label_values, 'le="+Inf"'), count
+            yield self.name + '_sum', _format_labels(self.labels, label_values), total
+            yield self.name + '_count', _format_labels(self.labels, label_values), count
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                label_values: {'count': count, 'sum': total, 'buckets': dict(zip(self.buckets + (float('inf'),), counts))}
+                for label_values, (counts, total, count) in self.values.items()
+            }
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.updates = Counter('tgrambot_updates_total', 'Updates processed.', ('bot', 'update_type'))
+        self.filter_duration = Histogram(
+            'tgrambot_filter_duration_seconds', 'Time spent finding the handler for an update.', ('bot', 'update_type')
+        )
+        self.handler_duration = Histogram(
+            'tgrambot_handler_duration_seconds', 'Time spent in handlers.', ('bot', 'update_type', 'handler')
+        )
+        self.handler_errors = Counter(
+            'tgrambot_handler_errors_total', 'Handlers that raised.', ('bot', 'update_type', 'handler')
+        )
+        self.filter_errors = Counter(
+            'tgrambot_filter_errors_total', 'Handler filters that raised.', ('bot', 'update_type', 'handler')
+        )
+        self.middleware_duration = Histogram(
+            'tgrambot_middleware_duration_seconds', 'Time spent in middleware hooks.',
+            ('bot', 'update_type', 'middleware', 'stage'),
+        )
+        self.api_duration = Histogram(
+            'tgrambot_api_request_duration_seconds', 'Bot API request latency.', ('bot', 'method')
+        )
+        self.api_errors = Counter(
+            'tgrambot_api_errors_total', 'Bot API requests that failed.', ('bot', 'method', 'error_code')
+        )
+        self.queue_depth = Gauge('tgrambot_queue_depth', 'Updates waiting for a worker.', ('bot',))
+        self.all = [
+            self.updates, self.filter_duration, self.handler_duration, self.handler_errors,
+            self.filter_errors, self.middleware_duration, self.api_duration, self.api_errors, self.queue_depth,
+        ]
+
+    def observe_api(self, bot, method, started, response):
+        self.api_duration.observe(bot, method, value=time.perf_counter() - started)
+        if not isinstance(response, dict) or not response.get('ok'):
+            code = response.get('error_code') if isinstance(response, dict) else None
+            self.api_errors.inc(bot, method, str(code or 'exception'))
+
+    def render(self):
+        lines = []
+        for metric in self.all:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.all}
+
+
+registry = Metrics()
+
+
+def resolve(metrics):
+    if metrics is True:
+        return registry
+    return metrics or None
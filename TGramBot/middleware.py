@@ -0,0 +1,47 @@
+class Middleware:
+    """
+    Base class for code that runs around the handlers of every update.
+
+    pre runs before any handler is looked up and post after the handlers ran
+    (or one of them raised). Both get the converted update and a context dict
+    that lives for this update only: values put there by pre (a user record
+    loaded once, a permission flag, ...) are visible to post and to handlers
+    that take a `context` argument. context['handlers'] holds the handlers that
+    ran and context['error'] the exception a handler raised, if any.
+
+    Returning False from pre stops the update there: no handler and no later
+    middleware runs, only the post hooks of the middlewares that already ran.
+    With AsyncBot both hooks may be coroutine functions.
+
+    Usage:
+        class LoadUser(Middleware):
+            def pre(self, update_type, data, context):
+                context['user'] = db.load_user(data.from_user.id)
+                if context['user'].banned:
+                    return False
+
+        bot.add_middleware(LoadUser(), update_types=['message', 'callback_query'])
+    """
+
+    def pre(self, update_type, data, context):
+        return None
+
+    def post(self, update_type, data, context):
+        return None
+
+
+class FunctionMiddleware(Middleware):
+    """Middleware made from a plain pre or post function, see Dispatcher.before_update."""
+
+    def __init__(self, pre=None, post=None):
+        self.function = pre or post
+        # A missing hook is None so it is skipped rather than timed.
+        self.pre = pre
+        self.post = post
+
+
+def middleware_name(middleware):
+    function = getattr(middleware, 'function', None)
+    if function is not None:
+        return getattr(function, '__qualname__', None) or repr(function)
+    return type(middleware).__qualname__
@@ -0,0 +1,231 @@
+import itertools
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+from . import serializer
+from .transport import Transport
+
+
+class MockBotAPI:
+    """
+    In-process fake Bot API server for tests and benchmarks.
+
+    It answers getUpdates (long polling over the updates queued with
+    push_updates), getMe, sendMessage and the webhook methods, serves files
+    added with add_file through getFile and /file/bot<token>/<path>, and
+    answers every other method with {"ok": true, "result": true}.
+
+    Parameters:
+        latency (float or callable): Seconds added to every response except
+            getUpdates, or a function returning them.
+        error_rate (float): Fraction of calls answered with HTTP 502.
+        flood_rate (float): Fraction of calls answered with 429 Too Many Requests.
+        retry_after (int): retry_after sent with 429 answers.
+        seed (int): Seed of the fault injection, for repeatable runs.
+
+    Usage:
+        with MockBotAPI(latency=0.01) as api:
+            bot = Bot('1:test', transport=api.transport())
+            api.push_updates([...])
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, error_rate=0, flood_rate=0, retry_after=1, seed=None,
+                 history=10000):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.counts = Counter()
+        self.calls = deque(maxlen=history)
+        self.updates = []
+        self.files = {}
+        self.webhook = {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._new_updates = threading.Condition(self._lock)
+        self.server = ThreadingHTTPServer((host, port), _handler_class(self))
+        self.server.daemon_threads = True
+        self.thread = None
+        self._stopped = False
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def transport(self, **kwargs):
+        """A Transport pointing at this server."""
+        return Transport(base_url=self.base_url, **kwargs)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="TGramBot-mock-api", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._new_updates.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def push_updates(self, updates):
+        """Queues updates for getUpdates."""
+        with self._lock:
+            self.updates.extend(updates)
+            self._new_updates.notify_all()
+
+    def add_file(self, file_id, data, file_path=None):
+        self.files[file_id] = (file_path or f"documents/{file_id}", data)
+
+    def _delay(self):
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+    def _fault(self):
+        if self.error_rate and self.random.random() < self.error_rate:
+            return 502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'}
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            return 429, {
+                'ok': False, 'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            }
+        return None
+
+    def call(self, method, params):
+        """Answers one API call; returns (status, response)."""
+        with self._lock:
+            self.counts[method] += 1
+            self.calls.append((method, params))
+        if method != 'getUpdates':
+            self._delay()
+        fault = self._fault()
+        if fault is not None:
+            return fault
+        handler = getattr(self, f"_api_{method}", None)
+        result = handler(params) if handler is not None else True
+        return 200, {'ok': True, 'result': result}
+
+    def _api_getUpdates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._lock:
+            while True:
+                # Confirmed updates are dropped, as Telegram does.
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+                remaining = deadline - time.monotonic()
+                if self.updates or remaining <= 0 or self._stopped:
+                    return self.updates[:limit]
+                self._new_updates.wait(remaining)
+
+    def _api_getMe(self, params):
+        return {'id': 1, 'is_bot': True, 'first_name': 'Mock', 'username': 'mock_bot'}
+
+    def _api_sendMessage(self, params):
+        return {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': params.get('chat_id'), 'type': 'private'},
+            'text': params.get('text'),
+        }
+
+    def _api_setWebhook(self, params):
+        self.webhook['url'] = params.get('url', '')
+        return True
+
+    def _api_deleteWebhook(self, params):
+        self.webhook['url'] = ''
+        return True
+
+    def _api_getWebhookInfo(self, params):
+        return dict(self.webhook)
+
+    def _api_getFile(self, params):
+        file_id = params.get('file_id')
+        file_path, data = self.files.get(file_id, (None, b''))
+        return {'file_id': file_id, 'file_unique_id': f"u{file_id}", 'file_size': len(data), 'file_path': file_path}
+
+
+def _handler_class(api):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Send headers and body in one segment; split writes on a keep-alive
+        # connection hit delayed ACKs and add ~40 ms to every call.
+        wbufsize = -1
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _read_body(self):
+            if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip() or b'0', 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return b''.join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+            return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        def _send(self, status, body, content_type='application/json'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self._read_body()
+            method = self.path.rsplit('/', 1)[-1]
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('application/json') and body:
+                params = serializer.loads(body)
+            elif content_type.startswith('application/x-www-form-urlencoded'):
+                params = dict(parse_qsl(body.decode()))
+            else:
+                # multipart uploads are accepted without being parsed
+                params = {}
+            status, response = api.call(method, params)
+            self._send(status, serializer.dumps(response))
+
+        def do_GET(self):
+            if not self.path.startswith('/file/'):
+                method = self.path.rsplit('/', 1)[-1].split('?', 1)[0]
+                query = dict(parse_qsl(self.path.split('?', 1)[1])) if '?' in self.path else {}
+                status, response = api.call(method, query)
+                self._send(status, serializer.dumps(response))
+                return
+            file_path = self.path.split('/', 3)[-1]
+            data = next((data for path, data in api.files.values() if path == file_path), None)
+            if data is None:
+                self._send(404, b'Not Found', 'text/plain')
+                return
+            start = 0
+            range_header = self.headers.get('Range', '')
+            if range_header.startswith('bytes='):
+                start = int(range_header[6:].split('-', 1)[0] or 0)
+            self.send_response(206 if start else 200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            if start:
+                self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+            self.send_header('Content-Length', str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+    return Handler
@@ -0,0 +1,203 @@
+"""
+Streaming multipart/form-data encoder for uploads.
+
+The body is produced chunk by chunk while it is sent, so only one chunk of a
+file is held in memory at a time. Files may be given as:
+    - a path (pathlib.Path or any os.PathLike), opened when its part is sent;
+    - an open binary file object;
+    - bytes, bytearray, memoryview or mmap;
+    - a (filename, file) or (filename, file, content_type) tuple of the above.
+Plain str values are never treated as files: in the Bot API they are file_ids
+or URLs.
+"""
+import mimetypes
+import mmap
+import os
+import uuid
+
+from . import serializer
+
+default_chunk_size = 64 * 1024
+
+_buffer_types = (bytes, bytearray, memoryview, mmap.mmap)
+
+
+def is_file_input(value):
+    if isinstance(value, (_buffer_types, os.PathLike)):
+        return True
+    if isinstance(value, tuple) and len(value) in (2, 3) and isinstance(value[0], str):
+        return is_file_input(value[1])
+    return hasattr(value, 'read')
+
+
+def split_params(params, files=None):
+    """
+    Moves file inputs found in params (e.g. a local `thumbnail`) into files and
+    returns (params, files) with files None when there is nothing to upload.
+    """
+    params = dict(params or {})
+    files = {key: value for key, value in (files or {}).items() if value is not None}
+    for key in [key for key, value in params.items() if is_file_input(value)]:
+        files[key] = params.pop(key)
+    return params, files or None
+
+
+def attach_media(media, fields=('media', 'thumbnail')):
+    """
+    Replaces local files inside InputMedia dicts with attach://<name> references.
+
+    Returns the list of media dicts (copies, every other field untouched) and a
+    files dict mapping each attach name to its file, or None when all media
+    are file_ids or URLs.
+    """
+    items = []
+    files = {}
+    for index, item in enumerate(media):
+        item = dict(item)
+        for field in fields:
+            value = item.get(field)
+            if value is not None and is_file_input(value):
+                name = f"{field}{index}"
+                files[name] = value
+                item[field] = f"attach://{name}"
+        items.append(item)
+    return items, files or None
+
+
+def form_value(value):
+    return value if isinstance(value, str) else serializer.dumps(value).decode('utf-8')
+
+
+def _quote(value):
+    return value.replace('\\', '\\\\').replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class _FilePart:
+    def __init__(self, name, value):
+        content_type = None
+        filename = None
+        if isinstance(value, tuple):
+            if len(value) == 3:
+                filename, value, content_type = value
+            else:
+                filename, value = value
+        if filename is None:
+            if isinstance(value, os.PathLike):
+                filename = os.path.basename(os.fspath(value))
+            elif isinstance(getattr(value, 'name', None), str):
+                filename = os.path.basename(value.name)
+            else:
+                filename = name
+        if content_type is None:
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.value = value
+        self.start = None
+        if hasattr(value, 'read'):
+            try:
+                if value.seekable():
+                    # Remembered so the body can be produced again when a request is retried.
+                    self.start = value.tell()
+            except (AttributeError, OSError, ValueError):
+                pass
+
+    def header(self, boundary):
+        return (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{_quote(self.name)}"; filename="{_quote(self.filename)}"\r\n'
+            f'Content-Type: {self.content_type}\r\n\r\n'
+        ).encode('utf-8')
+
+    def size(self):
+        value = self.value
+        if isinstance(value, _buffer_types):
+            return len(memoryview(value).cast('B'))
+        if isinstance(value, os.PathLike):
+            return os.stat(value).st_size
+        if self.start is None:
+            return None
+        end = value.seek(0, os.SEEK_END)
+        value.seek(self.start)
+        return end - self.start
+
+    def chunks(self, chunk_size):
+        value = self.value
+        if isinstance(value, _buffer_types):
+            view = memoryview(value).cast('B')
+            for start in range(0, len(view), chunk_size):
+                yield bytes(view[start:start + chunk_size])
+        elif isinstance(value, os.PathLike):
+            with open(value, 'rb') as f:
+                yield from _read_chunks(f, chunk_size)
+        else:
+            if self.start is not None:
+                value.seek(self.start)
+            yield from _read_chunks(value, chunk_size)
+
+
+def _read_chunks(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class MultipartEncoder:
+    """
+    Iterable multipart/form-data body. Non-str field values are JSON encoded
+    (reply_markup, entities, ...); None values are skipped.
+
+    content_length is the exact body size, or None when a file object cannot
+    report its size, in which case the body has to be sent chunked.
+    """
+
+    def __init__(self, fields=None, files=None, chunk_size=default_chunk_size, boundary=None):
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.fields = [
+            self._field_bytes(name, value) for name, value in (fields or {}).items() if value is not None
+        ]
+        self.files = [_FilePart(name, value) for name, value in (files or {}).items()]
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def _field_bytes(self, name, value):
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+            f'{form_value(value)}\r\n'
+        ).encode('utf-8')
+
+    def _closing(self):
+        return f'--{self.boundary}--\r\n'.encode('utf-8')
+
+    @property
+    def content_length(self):
+        length = sum(len(field) for field in self.fields) + len(self._closing())
+        for part in self.files:
+            size = part.size()
+            if size is None:
+                return None
+            length += len(part.header(self.boundary)) + size + 2
+        return length
+
+    def headers(self):
+        headers = {'Content-Type': self.content_type}
+        length = self.content_length
+        if length is not None:
+            headers['Content-Length'] = str(length)
+        return headers
+
+    def __iter__(self):
+        if self.fields:
+            yield b''.join(self.fields)
+        for part in self.files:
+            yield part.header(self.boundary)
+            yield from part.chunks(self.chunk_size)
+            yield b'\r\n'
+        yield self._closing()
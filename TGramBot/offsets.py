@@ -0,0 +1,170 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import deque
+
+
+class MemoryUpdateStore:
+    """
+    Keeps the polling offset and a bounded window of recently seen update_ids.
+
+    `update_id in store` tells whether an update was already delivered (it is in
+    the window, or below the committed offset), so redeliveries are dropped
+    with a set lookup. seen(update_id) does the same check and marks the update
+    in one step, for webhooks where the same update may arrive concurrently.
+    commit(offset) records that every update before offset has been handled.
+    This class keeps everything in memory; the subclasses persist it so a
+    restarted bot continues where it stopped.
+
+    Polling only commits after a batch was handled, so a crash redelivers it
+    (at-least-once). A webhook update is marked when it is accepted, before its
+    handler runs; Telegram does not resend an update it got a 200 for, so one
+    lost to a crash while queued is not recovered either way.
+
+    Parameters:
+        window (int): How many recent update_ids to remember for deduplication.
+    """
+
+    def __init__(self, window=10000):
+        self.window = window
+        self.offset = 0
+        self._seen = set()
+        self._order = deque()
+        self._lock = threading.Lock()
+        self._load()
+
+    def _remember(self, update_id):
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        while len(self._order) > self.window:
+            self._seen.discard(self._order.popleft())
+
+    def __contains__(self, update_id):
+        with self._lock:
+            return update_id < self.offset or update_id in self._seen
+
+    def seen(self, update_id):
+        with self._lock:
+            if update_id < self.offset or update_id in self._seen:
+                return True
+            self._remember(update_id)
+            self._mark(update_id)
+            return False
+
+    def forget(self, update_id):
+        """Unmarks an update that could not be accepted, so its redelivery is handled."""
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.discard(update_id)
+                self._order.remove(update_id)
+            self._unmark(update_id)
+
+    def commit(self, offset=None):
+        with self._lock:
+            if offset is not None and offset > self.offset:
+                self.offset = offset
+            self._save()
+
+    def _load(self):
+        pass
+
+    def _mark(self, update_id):
+        pass
+
+    def _unmark(self, update_id):
+        pass
+
+    def _save(self):
+        pass
+
+
+class FileUpdateStore(MemoryUpdateStore):
+    """
+    Writes the offset and the dedup window to a JSON file, atomically (write
+    then rename), on every commit and whenever an update is marked or unmarked,
+    so webhook bots, which never commit, persist their window too. That is one
+    file write per webhook update; SQLiteUpdateStore is cheaper under load.
+    """
+
+    def __init__(self, path, window=10000):
+        self.path = path
+        super().__init__(window)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.offset = state.get('offset', 0)
+        for update_id in state.get('seen', [])[-self.window:]:
+            self._remember(update_id)
+
+    def _mark(self, update_id):
+        self._save()
+
+    def _unmark(self, update_id):
+        self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'offset': self.offset, 'seen': list(self._order)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteUpdateStore(MemoryUpdateStore):
+    """
+    Stores the offset and seen update_ids in SQLite. Update ids are written as
+    soon as they are seen, so webhook redeliveries are caught across restarts
+    even between commits.
+    """
+
+    def __init__(self, path, window=10000):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS update_offset (id INTEGER PRIMARY KEY, offset INTEGER)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY)")
+        super().__init__(window)
+
+    def _load(self):
+        row = self.connection.execute("SELECT offset FROM update_offset WHERE id = 1").fetchone()
+        if row is not None:
+            self.offset = row[0]
+        rows = self.connection.execute(
+            "SELECT update_id FROM seen_updates ORDER BY update_id DESC LIMIT ?", (self.window,)
+        ).fetchall()
+        for (update_id,) in reversed(rows):
+            self._remember(update_id)
+
+    def _mark(self, update_id):
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO seen_updates (update_id) VALUES (?)", (update_id,))
+            # Webhook bots never commit, so the window is also trimmed here.
+            self._prune()
+
+    def _unmark(self, update_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM seen_updates WHERE update_id = ?", (update_id,))
+
+    def _save(self):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO update_offset (id, offset) VALUES (1, ?)", (self.offset,)
+            )
+            self._prune()
+
+    def _prune(self):
+        if self._order:
+            self.connection.execute("DELETE FROM seen_updates WHERE update_id < ?", (self._order[0],))
+
+    def close(self):
+        self.connection.close()
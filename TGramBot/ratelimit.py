@@ -0,0 +1,132 @@
+import threading
+import time
+
+# Bot API methods that post something to a chat and count against Telegram's limits.
+rate_limited_prefixes = ('send', 'copy', 'forward', 'edit')
+
+
+def is_rate_limited(method):
+    return method.startswith(rate_limited_prefixes)
+
+
+def is_group_chat(chat_id):
+    if isinstance(chat_id, int):
+        return chat_id < 0
+    return isinstance(chat_id, str) and chat_id[:1] in ('-', '@')
+
+
+class _Bucket:
+    """
+    Token bucket kept as a theoretical arrival time (GCRA): `rate` requests per
+    `period` seconds with bursts of up to `burst` requests.
+    """
+
+    def __init__(self, rate, period=1.0, burst=1):
+        self.interval = period / rate
+        self.tolerance = self.interval * (burst - 1)
+
+
+class RateLimiter:
+    """
+    Schedules outgoing requests within Telegram's limits: a global rate for the
+    whole bot, a rate per chat and a stricter per-minute rate for groups and
+    channels.
+
+    reserve() never sleeps itself: it books the earliest free slot and returns
+    how long the caller has to wait. A request first reserves its chat slot and
+    waits for it, then reserves a global slot. The global bucket is therefore
+    only booked once a request is actually ready to go, and a chat that is
+    being held back does not delay requests to other chats. Flood-wait errors
+    push the affected bucket forward by retry_after.
+
+    Parameters:
+        global_rate (float): Requests per second across all chats.
+        chat_rate (float): Requests per second to a single chat.
+        group_rate (float): Requests per minute to a single group or channel.
+        burst (int): Requests allowed back to back before a bucket starts spacing them.
+        max_retries (int): How many times a request is retried after a 429 error.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, group_rate=20, burst=3, max_retries=5):
+        self.global_bucket = _Bucket(global_rate, 1.0, burst)
+        self.chat_bucket = _Bucket(chat_rate, 1.0, burst)
+        self.group_bucket = _Bucket(group_rate, 60.0, burst)
+        self.max_retries = max_retries
+        self._global_tat = 0.0
+        self._chat_tats = {}
+        self._group_tats = {}
+        self._lock = threading.Lock()
+        self._reservations = 0
+
+    def _buckets(self, chat_id):
+        if chat_id is None:
+            return [(self.global_bucket, None, None)]
+        key = str(chat_id)
+        buckets = [(self.chat_bucket, self._chat_tats, key)]
+        if is_group_chat(key):
+            buckets.append((self.group_bucket, self._group_tats, key))
+        return buckets
+
+    def _get_tat(self, tats, key):
+        return self._global_tat if tats is None else tats.get(key, 0.0)
+
+    def _set_tat(self, tats, key, value):
+        if tats is None:
+            self._global_tat = value
+        else:
+            tats[key] = value
+
+    def reserve(self, chat_id=None):
+        """
+        Books a slot in chat_id's buckets, or in the global bucket when chat_id is
+        None, and returns the delay in seconds until that slot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            buckets = self._buckets(chat_id)
+            start = now
+            for bucket, tats, key in buckets:
+                start = max(start, self._get_tat(tats, key) - bucket.tolerance)
+            for bucket, tats, key in buckets:
+                self._set_tat(tats, key, max(self._get_tat(tats, key), start) + bucket.interval)
+
+            self._reservations += 1
+            if self._reservations % 1000 == 0:
+                self._prune(now)
+            return start - now
+
+    def flood_wait(self, chat_id, retry_after):
+        """
+        Holds back requests after Telegram answered 429 with retry_after. The
+        chat is paused when the request had one, otherwise the whole bot.
+        """
+        with self._lock:
+            until = time.monotonic() + retry_after
+            if chat_id is None:
+                self._global_tat = max(self._global_tat, until + self.global_bucket.tolerance)
+            else:
+                key = str(chat_id)
+                self._chat_tats[key] = max(self._chat_tats.get(key, 0.0), until + self.chat_bucket.tolerance)
+
+    def acquire(self, chat_id=None, sleep=time.sleep):
+        """
+        Blocks until a request to chat_id may be sent.
+        """
+        if chat_id is not None:
+            delay = self.reserve(chat_id)
+            if delay > 0:
+                sleep(delay)
+        delay = self.reserve()
+        if delay > 0:
+            sleep(delay)
+
+    def _prune(self, now):
+        for tats in (self._chat_tats, self._group_tats):
+            for key in [key for key, tat in tats.items() if tat < now]:
+                del tats[key]
+
+
+def get_retry_after(response):
+    if isinstance(response, dict) and response.get('error_code') == 429:
+        return (response.get('parameters') or {}).get('retry_after')
+    return None
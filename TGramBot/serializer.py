@@ -0,0 +1,58 @@
+"""
+JSON codec used for Bot API requests and webhook bodies.
+
+orjson or msgspec is used when installed, otherwise the standard library.
+Whatever the backend, dumps() returns UTF-8 bytes ready to be sent and
+loads() accepts the bytes read from the socket as they are, without a
+separate .decode() copy.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def stdlib_dumps(obj):
+    return _stdlib_encoder.encode(obj).encode('utf-8')
+
+
+stdlib_loads = json.loads
+
+
+if orjson is not None:
+    backend = 'orjson'
+    _orjson_options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj, option=_orjson_options)
+        except TypeError:
+            # e.g. integers wider than 64 bits, which only the stdlib encodes
+            return stdlib_dumps(obj)
+
+    loads = orjson.loads
+elif msgspec is not None:
+    backend = 'msgspec'
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+
+    def dumps(obj):
+        try:
+            return _msgspec_encoder.encode(obj)
+        except TypeError:
+            return stdlib_dumps(obj)
+
+    loads = _msgspec_decoder.decode
+else:
+    backend = 'json'
+    dumps = stdlib_dumps
+    loads = stdlib_loads
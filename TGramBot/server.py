@@ -0,0 +1,138 @@
+import queue
+
+from . import serializer
+from .log import logger
+from .utils import get_update_key
+from .workers import ProcessWorkerPool, ShardedWorkerPool
+
+
+def create_app(*bots, workers=4, queue_size=1000, queue_timeout=5, app=None, metrics=False, processes=0):
+    """
+    Builds a Flask (WSGI) app that receives webhooks for one or more bots, each
+    on its own /{bot.name}/webhook route.
+
+    The route acknowledges the update as soon as it is queued; handlers run on
+    a ShardedWorkerPool per bot, keeping per-chat order. When the queue stays
+    full for queue_timeout seconds the route answers 503 so Telegram delivers
+    the update again later. workers=0 runs handlers inside the request.
+    processes=N hands updates to N worker processes instead (see
+    workers.ProcessWorkerPool), routed by a consistent hash of the chat id.
+
+    Serve it with any WSGI server, e.g. `gunicorn -w 4 'mybot:app'` where
+    `app = create_app(bot)`. Every server process gets its own worker pool.
+
+    Bots with an update_store answer redelivered updates with 200 without
+    handling them again.
+
+    With metrics=True a GET /metrics route serves the bots' metrics in the
+    Prometheus text format; give the bots one shared Metrics registry
+    (Bot(metrics=True) does) so every series appears once.
+    """
+    from flask import Flask, request
+
+    if app is None:
+        app = Flask(__name__)
+
+    def add_route(bot):
+        if processes:
+            pool = ProcessWorkerPool(bot.process_update, processes, queue_size, initializer=bot.reset_connections)
+        else:
+            pool = ShardedWorkerPool(bot.process_update, workers, queue_size) if workers else None
+        if pool is not None and bot.metrics is not None:
+            bot.metrics.queue_depth.set_function(bot.metrics_label, function=pool.qsize)
+
+        def handle_update():
+            update = serializer.loads(request.get_data())
+            logger.debug("Webhook update for %s: %s", bot.name, update)
+            store = bot.update_store
+            if store is not None and store.seen(update['update_id']):
+                logger.debug("Skipping duplicate update %s", update['update_id'])
+                return 'OK', 200
+            if pool is None:
+                bot.process_update(update)
+                return 'OK', 200
+            update_type = bot.extract_main_key(update)
+            try:
+                pool.submit(get_update_key(update_type, update[update_type]), update, timeout=queue_timeout)
+            except queue.Full:
+                if store is not None:
+                    store.forget(update['update_id'])
+                return 'Busy', 503
+            return 'OK', 200
+
+        app.add_url_rule(f'/{bot.name}/webhook', f'{bot.name}_webhook', handle_update, methods=['POST'])
+
+    for bot in bots:
+        add_route(bot)
+
+    if metrics:
+        registries = []
+        for bot in bots:
+            if bot.metrics is not None and all(bot.metrics is not registry for registry in registries):
+                registries.append(bot.metrics)
+
+        def render_metrics():
+            body = ''.join(registry.render() for registry in registries)
+            return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+        app.add_url_rule('/metrics', 'metrics', render_metrics, methods=['GET'])
+    return app
+
+
+def create_asgi_app(*bots):
+    """
+    Builds a dependency-free ASGI app that receives webhooks for one or more
+    AsyncBot instances on /{bot.name}/webhook, e.g. `uvicorn mybot:app`.
+
+    Each update is scheduled on the bot's event loop and acknowledged right
+    away; the bot's max_concurrent_updates bounds how many are in flight. On
+    lifespan shutdown scheduled updates and buffered batches are handled before
+    the bot's session is closed.
+    """
+    routes = {f'/{bot.name}/webhook': bot for bot in bots}
+
+    async def send_response(send, status, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'text/plain')],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    for bot in bots:
+                        await bot.drain()
+                        await bot.close_session()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
+        bot = routes.get(scope['path'])
+        if scope['type'] != 'http' or bot is None:
+            await send_response(send, 404, b'Not Found')
+            return
+        if scope['method'] != 'POST':
+            await send_response(send, 405, b'Method Not Allowed')
+            return
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        try:
+            update = serializer.loads(b''.join(chunks))
+        except Exception:
+            await send_response(send, 400, b'Bad Request')
+            return
+
+        await bot.feed_update(update)
+        await send_response(send, 200, b'OK')
+
+    return app
@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_missing = object()
+
+
+class MemoryStateStorage:
+    """
+    In-process LRU store keeping at most max_entries conversation states.
+    Entries not written for ttl seconds are dropped (ttl=None keeps them).
+
+    A state record is a dict {'state': str or None, 'data': dict}. Any object
+    with the same get/set/delete methods can be used as a backend, e.g. a thin
+    wrapper around a shared key-value store.
+    """
+
+    def __init__(self, max_entries=10000, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            record, written = entry
+            if self.ttl is not None and time.monotonic() - written > self.ttl:
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return record
+
+    def set(self, key, record):
+        with self._lock:
+            self.entries[key] = (record, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+class SQLiteStateStorage:
+    """
+    SQLite store that survives restarts. Records not written for ttl seconds
+    are treated as missing and removed.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS states (key TEXT PRIMARY KEY, record TEXT NOT NULL, written REAL NOT NULL)"
+            )
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self.connection.execute("SELECT record, written FROM states WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return default
+            if self.ttl is not None and time.time() - row[1] > self.ttl:
+                with self.connection:
+                    self.connection.execute("DELETE FROM states WHERE key = ?", (key,))
+                return default
+            return json.loads(row[0])
+
+    def set(self, key, record):
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO states (key, record, written) VALUES (?, ?, ?)",
+                (key, json.dumps(record), time.time()),
+            )
+
+    def delete(self, key):
+        with self._lock, self.connection:
+            self.connection.execute("DELETE FROM states WHERE key = ?", (key,))
+
+    def close(self):
+        self.connection.close()
+
+
+class CachedStateStorage:
+    """
+    Write-through cache in front of a slower backend (SQLite or a shared store).
+
+    Reads are answered from an in-process MemoryStateStorage, including the
+    common "this user has no state" answer, so dispatch only reaches the backend
+    the first time a key is seen. Writes go to the backend and the cache. With
+    several processes sharing one backend keep cache_ttl short, as each process
+    only sees the others' writes once its cached entry expires.
+    """
+
+    def __init__(self, backend, max_entries=10000, cache_ttl=None):
+        self.backend = backend
+        self.cache = MemoryStateStorage(max_entries, cache_ttl)
+
+    def get(self, key, default=None):
+        record = self.cache.get(key, _missing)
+        if record is _missing:
+            record = self.backend.get(key)
+            self.cache.set(key, record)
+        return default if record is None else record
+
+    def set(self, key, record):
+        self.backend.set(key, record)
+        self.cache.set(key, record)
+
+    def delete(self, key):
+        self.backend.delete(key)
+        self.cache.set(key, None)
+
+
+def state_key(chat_id, user_id):
+    return f"{chat_id}:{user_id}"
+
+
+class State:
+    """
+    State of one user in one chat, returned by bot.state(chat_id, user_id).
+
+    Usage:
+        bot.state(chat_id, user_id).set('waiting_name')
+        bot.state(chat_id, user_id).update(name='Alice')
+        bot.state(chat_id, user_id).finish()
+    """
+
+    def __init__(self, storage, chat_id, user_id):
+        self.storage = storage
+        self.key = state_key(chat_id, user_id)
+
+    def _record(self):
+        return self.storage.get(self.key) or {'state': None, 'data': {}}
+
+    def get(self):
+        """Returns the current state name or None."""
+        return self._record()['state']
+
+    def set(self, state, data=None):
+        """Moves to state, keeping the stored data unless data is given."""
+        record = self._record()
+        self.storage.set(self.key, {'state': state, 'data': record['data'] if data is None else data})
+
+    @property
+    def data(self):
+        """A copy of the data stored with the state."""
+        return dict(self._record()['data'])
+
+    def update(self, **values):
+        record = self._record()
+        self.storage.set(self.key, {'state': record['state'], 'data': {**record['data'], **values}})
+
+    def finish(self):
+        """Clears both the state and its data."""
+        self.storage.delete(self.key)
@@ -0,0 +1,111 @@
+import urllib3
+from urllib3.util import Retry, Timeout
+
+polling_methods = ('getUpdates',)
+
+idempotent_prefixes = ('get', 'download')
+
+
+class Transport:
+    """
+    HTTP settings for Bot API requests made by Methods.
+
+    Parameters:
+        base_url (str): Bot API server, e.g. a self-hosted telegram-bot-api or
+            mock_api.MockBotAPI.
+        connect_timeout (float): Seconds to wait for a TCP/TLS connection.
+        read_timeout (float): Seconds to wait for each read of an ordinary response.
+        upload_timeout (float): Read timeout of requests that upload files.
+        polling_margin (float): getUpdates waits for its long-poll timeout plus this margin.
+        method_timeouts (dict): Per-method (connect, read) overrides, e.g.
+            {'sendDocument': (5, 300)}. The key 'download' applies to file downloads.
+        num_pools (int): Number of hosts each PoolManager keeps pools for.
+        pool_maxsize (int): Connections kept alive per host for sends. Raise it to
+            the number of threads sending in parallel.
+        pool_block (bool): Wait for a free connection instead of opening extra ones.
+        retries (int): Retries after connection errors and retry_statuses.
+        backoff_factor (float): Base of the exponential delay between retries.
+        backoff_jitter (float): Up to this many random seconds added to each delay.
+        retry_statuses (tuple): HTTP statuses that are retried.
+        http2 (bool): Use urllib3's HTTP/2 support (urllib3 2.3+ with h2 installed),
+            which multiplexes concurrent requests over one connection. urllib3
+            enables it process-wide.
+
+    getUpdates gets its own single-connection pool, so a long poll never holds a
+    connection sends are waiting for. Connection errors are always safe to retry,
+    as the request was not sent. A timed-out read is only retried for get*
+    methods, since a send that timed out may already have been delivered.
+    """
+
+    def __init__(self, base_url='https://api.telegram.org', connect_timeout=5, read_timeout=30, upload_timeout=120,
+                 polling_margin=10, method_timeouts=None, num_pools=10, pool_maxsize=10, pool_block=False,
+                 retries=3, backoff_factor=0.5, backoff_jitter=0.5, retry_statuses=(500, 502, 503, 504), http2=False):
+        self.base_url = base_url.rstrip('/')
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.upload_timeout = upload_timeout
+        self.polling_margin = polling_margin
+        self.method_timeouts = method_timeouts or {}
+        self.num_pools = num_pools
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.retry_statuses = retry_statuses
+        self.http2 = http2
+        if http2:
+            try:
+                import urllib3.http2
+            except ImportError:
+                raise ImportError("http2=True requires urllib3>=2.3 with h2: pip install 'urllib3[h2]'")
+            urllib3.http2.inject_into_urllib3()
+
+    def pool_manager(self):
+        """PoolManager for sends and every other method except getUpdates."""
+        return urllib3.PoolManager(num_pools=self.num_pools, maxsize=self.pool_maxsize, block=self.pool_block)
+
+    def polling_pool_manager(self):
+        """PoolManager for getUpdates, keeping one connection alive between polls."""
+        return urllib3.PoolManager(num_pools=1, maxsize=1)
+
+    def timeouts(self, method, params=None, files=None):
+        """(connect, read) seconds for one request."""
+        if method in self.method_timeouts:
+            return self.method_timeouts[method]
+        if method in polling_methods:
+            return self.connect_timeout, ((params or {}).get('timeout') or 0) + self.polling_margin
+        if files:
+            return self.connect_timeout, self.upload_timeout
+        return self.connect_timeout, self.read_timeout
+
+    def timeout(self, method, params=None, files=None):
+        connect, read = self.timeouts(method, params, files)
+        return Timeout(connect=connect, read=read)
+
+    def retry(self, method, files=None):
+        """
+        Retry policy for one request. Streamed uploads cannot be rewound, so they
+        are only retried when the connection could not be opened. Long polls are
+        too: a read timeout already took the whole long-poll timeout, and the
+        polling loop backs off and polls again on its own.
+        """
+        polling = method in polling_methods
+        idempotent = method.startswith(idempotent_prefixes) and not polling
+        options = dict(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries if idempotent else 0,
+            status=0 if files or polling else self.retries,
+            other=0,
+            allowed_methods=None,
+            status_forcelist=self.retry_statuses,
+            backoff_factor=self.backoff_factor,
+            raise_on_status=False,
+            respect_retry_after_header=False,
+        )
+        try:
+            return Retry(backoff_jitter=self.backoff_jitter, **options)
+        except TypeError:
+            # urllib3 < 2 has no backoff_jitter
+            return Retry(**options)
@@ -23,24 +23,192 @@ update_types = [
     "business_connection", "business_message", "edited_business_message", "deleted_business_messages"
 ]
 
-content_type_media = [
-    'text', 'animation', 'audio', 'document', 'photo',
-    'sticker', 'video', 'voice', 'contact',
-]
+_namedtuple_classes = {}
+_sanitized_keys = {}
+_max_namedtuple_classes = 4096
+
+
+def sanitize_key(key):
+    sanitized = _sanitized_keys.get(key)
+    if sanitized is None:
+        sanitized = key.replace('-', '_').replace(' ', '_').replace('.', '_').replace('from', 'from_user')
+        _sanitized_keys[key] = sanitized
+    return sanitized
 
-def to_namedtuple(name, d):
-    def sanitize_key(key):
-        return key.replace('-', '_').replace(' ', '_').replace('.', '_').replace('from', 'from_user')
 
+def get_namedtuple_class(name, fields):
+    """
+    Returns the namedtuple class for a type name and a tuple of field names.
+
+    Classes are built once per (name, fields) pair and reused for every
+    following update with the same shape.
+    """
+    key = (name, fields)
+    cls = _namedtuple_classes.get(key)
+    if cls is None:
+        if len(_namedtuple_classes) >= _max_namedtuple_classes:
+            _namedtuple_classes.clear()
+        cls = namedtuple(name, fields)
+        _namedtuple_classes[key] = cls
+    return cls
+
+
+def to_namedtuple(name, d):
     def convert_dict(name, d):
-        sanitized_dict = {}
+        fields = []
+        values = []
         for key, value in d.items():
             sanitized_key = sanitize_key(key)
+            fields.append(sanitized_key)
             if isinstance(value, dict):
-                sanitized_dict[sanitized_key] = convert_dict(sanitized_key, value)
+                values.append(convert_dict(sanitized_key, value))
             else:
-                sanitized_dict[sanitized_key] = value
-        return namedtuple(name, sanitized_dict.keys())(*sanitized_dict.values())
-    
+                values.append(value)
+        return get_namedtuple_class(name, tuple(fields))._make(values)
+
     return convert_dict(name, d)
 
+
+class UpdateView:
+    """
+    Read-only view over a raw update dict with the same attribute access as
+    to_namedtuple.
+
+    Nested dicts (and lists of dicts such as entities or photo) are wrapped
+    only when they are first read, so filters that reject an update after
+    looking at one or two fields never pay for converting the rest of it.
+    Items also support dict-style reads with the raw Telegram key, which keeps
+    code written for the plain dicts inside lists working.
+    """
+
+    __slots__ = ('_name', '_data', '_cache')
+
+    def __init__(self, name, data):
+        self._name = name
+        self._data = data
+        self._cache = None
+
+    def _raw_key(self, attr):
+        data = self._data
+        if attr in data and sanitize_key(attr) == attr:
+            return attr
+        for key in data:
+            if sanitize_key(key) == attr:
+                return key
+        return None
+
+    def _wrap(self, attr, value):
+        if isinstance(value, dict):
+            return UpdateView(attr, value)
+        if isinstance(value, list):
+            return _wrap_list(attr, value)
+        return value
+
+    def __getattr__(self, attr):
+        # copy and pickle probe half-built instances for __setstate__ and the
+        # like before any slot is set; answer without touching the slots.
+        if attr.startswith('__') or attr in UpdateView.__slots__:
+            raise AttributeError(attr)
+        cache = self._cache
+        if cache is not None and attr in cache:
+            return cache[attr]
+        key = self._raw_key(attr)
+        if key is None:
+            raise AttributeError(f"'{self._name}' object has no attribute '{attr}'")
+        value = self._data[key]
+        if not isinstance(value, (dict, list)):
+            return value
+        value = self._wrap(attr, value)
+        if cache is None:
+            cache = self._cache = {}
+        cache[attr] = value
+        return value
+
+    def __reduce__(self):
+        return (UpdateView, (self._name, self._data))
+
+    def __getitem__(self, key):
+        return getattr(self, sanitize_key(key)) if key in self._data else self._data[key]
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        return self[key] if key in self._data else default
+
+    def keys(self):
+        return self._data.keys()
+
+    @property
+    def _fields(self):
+        return tuple(sanitize_key(key) for key in self._data)
+
+    def _asdict(self):
+        return {field: getattr(self, field) for field in self._fields}
+
+    def to_dict(self):
+        return self._data
+
+    def __eq__(self, other):
+        if isinstance(other, UpdateView):
+            return self._data == other._data
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        fields = ', '.join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{self._name}({fields})"
+
+
+def _wrap_list(name, items):
+    if not any(isinstance(item, (dict, list)) for item in items):
+        return items
+    return [
+        UpdateView(name, item) if isinstance(item, dict)
+        else _wrap_list(name, item) if isinstance(item, list)
+        else item
+        for item in items
+    ]
+
+
+def to_view(name, d):
+    return UpdateView(name, d)
+
+
+def get_update_key(update_type, data):
+    """
+    Returns the id used to keep updates of one conversation in order: the chat
+    id when the update has a chat (directly or through its message), otherwise
+    the id of the user who sent it.
+    """
+    if not isinstance(data, dict):
+        return None
+    chat = data.get('chat')
+    if chat is None and isinstance(data.get('message'), dict):
+        chat = data['message'].get('chat')
+    if isinstance(chat, dict):
+        return chat.get('id')
+    user = data.get('from') or data.get('user')
+    if isinstance(user, dict):
+        return user.get('id')
+    return None
+
+
+class TelegramPollingError(Exception):
+    def __init__(self, response):
+        self.response = response
+        super().__init__(response.get('description', 'getUpdates failed'))
+
+
+def polling_backoff(errors, error=None, maximum=60):
+    """
+    Returns how long to wait before polling again after `errors` failures in
+    a row: Telegram's retry_after when the error carries one, otherwise an
+    exponential delay starting at one second and capped at `maximum`.
+    """
+    if isinstance(error, TelegramPollingError):
+        retry_after = (error.response.get('parameters') or {}).get('retry_after')
+        if retry_after:
+            return retry_after
+    return min(maximum, 2 ** (errors - 1))
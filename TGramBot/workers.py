@@ -0,0 +1,265 @@
+import bisect
+import hashlib
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import wait
+
+from .log import logger
+
+_stop = object()
+
+
+class ShardedWorkerPool:
+    """
+    Runs func(item) on a fixed number of worker threads.
+
+    Every item is submitted with a key (usually a chat id) and items with the
+    same key always land on the same worker, so they are handled in the order
+    they were submitted while other keys run in parallel. Each worker has a
+    bounded queue; submit() blocks when it is full, which holds back the
+    caller (the poller) instead of letting the backlog grow without bound.
+    """
+
+    def __init__(self, func, workers=4, queue_size=100):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+        self.func = func
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = []
+        self._stopped = False
+        for index, worker_queue in enumerate(self.queues):
+            thread = threading.Thread(
+                target=self._worker, args=(worker_queue,), name=f"TGramBot-worker-{index}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def _worker(self, worker_queue):
+        while True:
+            item = worker_queue.get()
+            try:
+                if item is _stop or self._stopped:
+                    return
+                self.func(item)
+            except Exception:
+                logger.exception("Error in worker %s", threading.current_thread().name)
+            finally:
+                worker_queue.task_done()
+
+    def submit(self, key, item, timeout=None):
+        self.queues[hash(key) % len(self.queues)].put(item, timeout=timeout)
+
+    def qsize(self):
+        return sum(worker_queue.qsize() for worker_queue in self.queues)
+
+    def join(self):
+        for worker_queue in self.queues:
+            worker_queue.join()
+
+    def stop(self, wait=True):
+        """
+        With wait, workers handle what is already queued and stop returns once
+        they exited. Without it, stop returns right away, even if a queue is
+        full or a worker is stuck; workers exit after the item in hand and
+        queued items are dropped.
+        """
+        if not wait:
+            self._stopped = True
+        for worker_queue in self.queues:
+            if wait:
+                worker_queue.put(_stop)
+                continue
+            try:
+                worker_queue.put_nowait(_stop)
+            except queue.Full:
+                pass  # the worker sees _stopped when it takes its next item
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to node indexes.
+
+    Every node owns virtual_nodes points on the ring, so keys spread evenly and
+    a key's node only depends on the key and the number of nodes, not on
+    Python's per-process hash() seed.
+    """
+
+    def __init__(self, nodes, virtual_nodes=64):
+        points = []
+        for node in range(nodes):
+            for replica in range(virtual_nodes):
+                points.append((self._hash(f"{node}:{replica}"), node))
+        points.sort()
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], 'big')
+
+    def node_for(self, key):
+        index = bisect.bisect(self.hashes, self._hash(key))
+        return self.nodes[index % len(self.nodes)]
+
+
+def _process_worker(func, inbox, acks, initializer):
+    if initializer is not None:
+        initializer()
+    try:
+        while True:
+            message = inbox.get()
+            if message is None:
+                return
+            seq, item = message
+            try:
+                func(item)
+            except Exception:
+                logger.exception("Error in worker process %s", multiprocessing.current_process().name)
+            acks.put(seq)
+    except KeyboardInterrupt:
+        pass
+
+
+class ProcessWorkerPool:
+    """
+    Runs func(item) in worker processes, with the same submit/qsize/join/stop
+    interface as ShardedWorkerPool.
+
+    Keys are routed with a HashRing, so items with the same key (chat id) go
+    to the same process and keep their order. Workers acknowledge every item
+    they finish; a worker that dies is started again and the items it had not
+    acknowledged are sent to the new process in their original order. An item
+    that has been replayed max_attempts times without being acknowledged is
+    assumed to crash the worker and is dropped.
+
+    Workers are forked (where the platform supports it), so they inherit the
+    registered handlers. initializer runs first in every worker, e.g.
+    bot.reset_connections to avoid sharing the parent's HTTP sockets.
+    """
+
+    def __init__(self, func, processes=4, queue_size=100, initializer=None, max_attempts=3, virtual_nodes=64):
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        methods = multiprocessing.get_all_start_methods()
+        self.context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+        self.func = func
+        self.queue_size = queue_size
+        self.initializer = initializer
+        self.max_attempts = max_attempts
+        self.ring = HashRing(processes, virtual_nodes)
+        self.acks = self.context.SimpleQueue()
+        self.inboxes = [None] * processes
+        self.processes = [None] * processes
+        self.in_flight = [OrderedDict() for _ in range(processes)]
+        self.attempts = {}
+        self.owner = {}
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._stopping = False
+        for index in range(processes):
+            self._start(index)
+        self.monitor = threading.Thread(target=self._monitor, name="TGramBot-process-monitor", daemon=True)
+        self.monitor.start()
+
+    def _start(self, index):
+        inbox = self.context.Queue(maxsize=self.queue_size)
+        process = self.context.Process(
+            target=_process_worker, args=(self.func, inbox, self.acks, self.initializer),
+            name=f"TGramBot-process-{index}", daemon=True,
+        )
+        process.start()
+        self.inboxes[index] = inbox
+        self.processes[index] = process
+
+    def _drain_acks(self):
+        while not self.acks.empty():
+            seq = self.acks.get()
+            index = self.owner.pop(seq, None)
+            if index is not None:
+                self.in_flight[index].pop(seq, None)
+            self.attempts.pop(seq, None)
+        if not any(self.in_flight):
+            self._idle.notify_all()
+
+    def _restart(self, index):
+        logger.error(
+            "Worker process %s exited with code %s, restarting it",
+            self.processes[index].name, self.processes[index].exitcode,
+        )
+        self.inboxes[index].cancel_join_thread()
+        self._start(index)
+        pending = self.in_flight[index]
+        if pending:
+            # Only the oldest item can have been running when the worker died.
+            seq = next(iter(pending))
+            attempts = self.attempts[seq] = self.attempts.get(seq, 0) + 1
+            if attempts >= self.max_attempts:
+                logger.error("Dropping an update that crashed worker processes %d times", attempts)
+                del pending[seq]
+                self.owner.pop(seq, None)
+                self.attempts.pop(seq, None)
+        for seq, item in pending.items():
+            self.inboxes[index].put((seq, item))
+
+    def _monitor(self):
+        while True:
+            sentinels = [process.sentinel for process in self.processes]
+            wait(sentinels, timeout=0.1)
+            with self._lock:
+                # Find dead workers before reading acks, so every ack a worker wrote
+                # before exiting is read before its items are replayed.
+                dead = [index for index, process in enumerate(self.processes) if not process.is_alive()]
+                self._drain_acks()
+                if self._stopping:
+                    return
+                for index in dead:
+                    self._restart(index)
+
+    def submit(self, key, item, timeout=None):
+        index = self.ring.node_for(key)
+        with self._lock:
+            seq = self._seq = self._seq + 1
+            self.in_flight[index][seq] = item
+            self.owner[seq] = index
+            inbox = self.inboxes[index]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                inbox.put((seq, item), timeout=0.1)
+                return
+            except queue.Full:
+                pass
+            with self._lock:
+                if self.inboxes[index] is not inbox:
+                    # The worker was restarted meanwhile and the item replayed to it.
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.in_flight[index].pop(seq, None)
+                    self.owner.pop(seq, None)
+                    raise queue.Full
+
+    def qsize(self):
+        return sum(len(pending) for pending in self.in_flight)
+
+    def join(self):
+        with self._lock:
+            while any(self.in_flight):
+                self._idle.wait(0.1)
+                self._drain_acks()
+
+    def stop(self, wait=True):
+        with self._lock:
+            self._stopping = True
+        for inbox in self.inboxes:
+            inbox.put(None)
+        if wait:
+            for process in self.processes:
+                process.join()
+        self.monitor.join()
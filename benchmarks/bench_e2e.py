@@ -0,0 +1,195 @@
+"""
+End-to-end throughput benchmark against TGramBot.mock_api.MockBotAPI, so no
+request reaches api.telegram.org.
+
+A synthetic stream of message updates spread over --chats chats is fed to
+Bot.infinity_polling (--mode polling) or posted to the Flask webhook route
+from --clients concurrent connections (--mode webhook, needs flask). Every
+handler answers with sendMessage. The run reports updates/sec, p50/p99
+handler latency (including the sendMessage round trip) and peak RSS.
+
+Runs are repeatable: updates and injected faults are generated from --seed,
+and --json stores the parameters and environment with the numbers. Pass a
+previous file with --compare to print the change, e.g. between releases.
+
+Usage:
+    python benchmarks/bench_e2e.py [--mode polling|webhook|both] [--updates N] [--workers N]
+        [--latency SECONDS] [--error-rate R] [--flood-rate R] [--json out.json] [--compare old.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from TGramBot import Bot, create_app, serializer  # noqa: E402
+from TGramBot.mock_api import MockBotAPI  # noqa: E402
+from sample_updates import make_message_update  # noqa: E402
+
+
+def make_updates(count, chats):
+    return [make_message_update(update_id=i + 1, chat_id=100000 + i % chats, text="ping") for i in range(count)]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def make_bot(api, count):
+    bot = Bot('1:bench', name='bench', transport=api.transport(backoff_factor=0.01, backoff_jitter=0.01))
+    bot.me = {'id': 1, 'is_bot': True, 'first_name': 'Mock', 'username': 'mock_bot'}
+    latencies = []
+    done = threading.Event()
+
+    @bot.message_handler()
+    def reply(message):
+        started = time.perf_counter()
+        bot.send_message(message.chat.id, "pong")
+        latencies.append(time.perf_counter() - started)
+        if len(latencies) >= count:
+            done.set()
+
+    return bot, latencies, done
+
+
+def run_polling(args, api, updates):
+    bot, latencies, done = make_bot(api, len(updates))
+    api.push_updates(updates)
+    started = time.perf_counter()
+    poller = threading.Thread(target=bot.infinity_polling, kwargs={'workers': args.workers, 'timeout': 1})
+    poller.start()
+    done.wait()
+    elapsed = time.perf_counter() - started
+    bot.stop_polling()
+    poller.join()
+    return elapsed, latencies
+
+
+def run_webhook(args, api, updates):
+    import urllib3
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    bot, latencies, done = make_bot(api, len(updates))
+    app = create_app(bot, workers=args.workers or 4, queue_size=len(updates))
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/bench/webhook"
+    http = urllib3.PoolManager(maxsize=args.clients)
+
+    def post(chunk):
+        for update in chunk:
+            http.request('POST', url, body=serializer.dumps(update), headers={'Content-Type': 'application/json'})
+
+    clients = [threading.Thread(target=post, args=(updates[i::args.clients],)) for i in range(args.clients)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    done.wait()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    return elapsed, latencies
+
+
+def run(args, mode):
+    api = MockBotAPI(
+        latency=args.latency, error_rate=args.error_rate, flood_rate=args.flood_rate, retry_after=0, seed=args.seed
+    ).start()
+    try:
+        runner = run_polling if mode == 'polling' else run_webhook
+        elapsed, latencies = runner(args, api, make_updates(args.updates, args.chats))
+    finally:
+        api.stop()
+    return {
+        'updates': len(latencies),
+        'seconds': round(elapsed, 4),
+        'updates_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'api_calls': dict(api.counts),
+    }
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        revision = ''
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'serializer': serializer.backend,
+    }
+
+
+def compare(results, baseline):
+    print(f"\ncompared with {baseline['environment'].get('revision') or 'baseline'}:")
+    for mode, current in results.items():
+        previous = baseline['results'].get(mode)
+        if previous is None:
+            continue
+        for key in ('updates_per_sec', 'p50_ms', 'p99_ms', 'peak_rss_mb'):
+            change = (current[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+            print(f"  {mode:<8} {key:<16} {previous[key]:>12,.2f} -> {current[key]:>12,.2f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('polling', 'webhook', 'both'), default='polling')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=8, help="handler threads (0 = inline)")
+    parser.add_argument('--clients', type=int, default=8, help="concurrent webhook connections")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every API answer")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of API calls answered with 502")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="fraction of API calls answered with 429")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="previous --json output to compare with")
+    args = parser.parse_args()
+
+    modes = ('polling', 'webhook') if args.mode == 'both' else (args.mode,)
+    results = {}
+    print(f"{'mode':<8} {'updates/sec':>12} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    for mode in modes:
+        result = results[mode] = run(args, mode)
+        print(
+            f"{mode:<8} {result['updates_per_sec']:>12,.1f} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+            f"{result['peak_rss_mb']:>12.1f}"
+        )
+
+    report = {
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('json', 'compare')},
+        'environment': environment(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
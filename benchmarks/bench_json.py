@@ -0,0 +1,88 @@
+"""
+Compares the previous request/response JSON path (json.dumps, then
+json.loads(data.decode('utf-8'))) against TGramBot.serializer for typical
+payloads: a getUpdates response of message updates, a sendMessage request
+and an answerInlineQuery request.
+
+Usage:
+    python benchmarks/bench_json.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from TGramBot import serializer  # noqa: E402
+from sample_updates import make_callback_query_update, make_message_update  # noqa: E402
+
+
+def make_payloads():
+    updates = [make_message_update(update_id=i + 2) for i in range(50)]
+    updates += [make_callback_query_update(update_id=i + 100) for i in range(50)]
+    send_message = {
+        'chat_id': '123456789',
+        'text': 'مرحبا! Welcome to the bot. ' * 8,
+        'parse_mode': 'HTML',
+        'reply_markup': {
+            'inline_keyboard': [
+                [{'text': f'Page {i}', 'callback_data': f'page:{i}'} for i in range(row * 4, row * 4 + 4)]
+                for row in range(3)
+            ]
+        },
+    }
+    answer_inline_query = {
+        'inline_query_id': '4382000000000000001',
+        'results': [
+            {
+                'type': 'article',
+                'id': str(i),
+                'title': f'Result {i}',
+                'description': 'Some description for the result ' * 2,
+                'input_message_content': {'message_text': f'Result number {i}', 'parse_mode': 'HTML'},
+                'reply_markup': {'inline_keyboard': [[{'text': 'Open', 'url': f'https://example.com/{i}'}]]},
+            }
+            for i in range(50)
+        ],
+        'cache_time': 300,
+    }
+    return {
+        'getUpdates response (decode)': json.dumps({'ok': True, 'result': updates}).encode('utf-8'),
+        'sendMessage request (encode)': send_message,
+        'answerInlineQuery request (encode)': answer_inline_query,
+    }
+
+
+def legacy_dumps(obj):
+    return json.dumps(obj)
+
+
+def legacy_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def bench(func, payload, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(payload)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"serializer backend: {serializer.backend}")
+    print(f"{'payload':<36} {'legacy ops/sec':>16} {'serializer ops/sec':>20} {'speedup':>8}")
+    for label, payload in make_payloads().items():
+        if isinstance(payload, bytes):
+            legacy, current = legacy_loads, serializer.loads
+        else:
+            legacy, current = legacy_dumps, serializer.dumps
+        legacy_rate = bench(legacy, payload, iterations)
+        current_rate = bench(current, payload, iterations)
+        print(f"{label:<36} {legacy_rate:>16,.0f} {current_rate:>20,.0f} {current_rate / legacy_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
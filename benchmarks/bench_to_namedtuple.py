@@ -0,0 +1,69 @@
+"""
+Compares the cached update converter in TGramBot.utils against the previous
+converter that built a new namedtuple class for every nested dict.
+
+Usage:
+    python benchmarks/bench_to_namedtuple.py [count]
+"""
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from TGramBot.utils import to_namedtuple  # noqa: E402
+from sample_updates import make_message_update  # noqa: E402
+
+
+def legacy_to_namedtuple(name, d):
+    def sanitize_key(key):
+        return key.replace('-', '_').replace(' ', '_').replace('.', '_').replace('from', 'from_user')
+
+    def convert_dict(name, d):
+        sanitized_dict = {}
+        for key, value in d.items():
+            sanitized_key = sanitize_key(key)
+            if isinstance(value, dict):
+                sanitized_dict[sanitized_key] = convert_dict(sanitized_key, value)
+            else:
+                sanitized_dict[sanitized_key] = value
+        return namedtuple(name, sanitized_dict.keys())(*sanitized_dict.values())
+
+    return convert_dict(name, d)
+
+
+def measure(converter, updates):
+    start = time.perf_counter()
+    for update in updates:
+        converter("message", update["message"])
+    elapsed = time.perf_counter() - start
+
+    sample = updates[:200]
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [converter("message", update["message"]) for update in sample]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    size = sum(stat.size_diff for stat in stats if stat.size_diff > 0)
+    del kept
+
+    return len(updates) / elapsed, blocks / len(sample), size / len(sample)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    updates = [make_message_update(update_id=i + 2) for i in range(count)]
+
+    print(f"{'converter':<12} {'updates/sec':>14} {'allocs/update':>15} {'bytes/update':>14}")
+    for label, converter in (("legacy", legacy_to_namedtuple), ("cached", to_namedtuple)):
+        rate, blocks, size = measure(converter, updates)
+        print(f"{label:<12} {rate:>14,.0f} {blocks:>15,.1f} {size:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
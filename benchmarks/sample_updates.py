@@ -0,0 +1,51 @@
+def make_message_update(update_id=1, chat_id=123456789, text="/start hello"):
+    user = {
+        "id": chat_id,
+        "is_bot": False,
+        "first_name": "Ahmed",
+        "last_name": "Negm",
+        "username": "a7mednegm",
+        "language_code": "ar",
+    }
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "from": user,
+            "chat": {
+                "id": chat_id,
+                "first_name": "Ahmed",
+                "last_name": "Negm",
+                "username": "a7mednegm",
+                "type": "private",
+            },
+            "date": 1718000000,
+            "text": text,
+            "entities": [{"offset": 0, "length": 6, "type": "bot_command"}],
+            "reply_to_message": {
+                "message_id": update_id - 1,
+                "from": user,
+                "chat": {"id": chat_id, "type": "private"},
+                "date": 1717999990,
+                "photo": [
+                    {"file_id": "AgAD1", "file_unique_id": "AQAD1", "file_size": 1204, "width": 90, "height": 67},
+                    {"file_id": "AgAD2", "file_unique_id": "AQAD2", "file_size": 15320, "width": 320, "height": 240},
+                ],
+                "caption": "old photo",
+            },
+        },
+    }
+
+
+def make_callback_query_update(update_id=1, chat_id=123456789, data="page:2"):
+    message = make_message_update(update_id, chat_id)["message"]
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(4382000000000000000 + update_id),
+            "from": message["from"],
+            "message": message,
+            "chat_instance": "-1234567890123456789",
+            "data": data,
+        },
+    }
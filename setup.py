@@ -7,6 +7,10 @@ setup(
     install_requires=[
         # ضع هنا أي مكتبات تعتمد عليها حزمةك
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "http2": ["urllib3[h2]>=2.3"],
+    },
     author="Ahmed Negm",
     author_email="a7mednegm.x@gmail.com",
     description="None",